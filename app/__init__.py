@@ -1,9 +1,13 @@
-from flask import Flask
+from flask import Flask, g
 from flask_restx import Api
 from app.routes.membership import membership_ns
 from flask_sqlalchemy import SQLAlchemy
 from app.models.user import db
 from flask_cors import CORS
+from app.util.stripe_client import configure_stripe
+from app.util import stripe_memo
+from app.util.notification_outbox import ensure_sender
+from app.util.ledger import ensure_ledger_tables
 api = Api(title='Stripe Membership API', version='1.0', description='API for membership management with Stripe integration')
 
 def create_app():
@@ -23,9 +27,28 @@ def create_app():
         expose_headers=["Content-Type", "Authorization"],
     )
     app.config.from_object('app.config.Config')
+    configure_stripe()
+    # Drain notifications queued by this or earlier processes
+    ensure_sender()
     db.init_app(app)
+    # Webhooks write the ledger whether or not LEDGER_READS_ENABLED is set,
+    # so its tables must exist before the first event arrives
+    with app.app_context():
+        ensure_ledger_tables()
     api.init_app(app)
     api.add_namespace(membership_ns)
     api.add_namespace(admin_ns)
     app.register_blueprint(webhook_bp)
+
+    # Memoize Stripe retrieves for the duration of each request
+    @app.before_request
+    def open_stripe_memo():
+        g.stripe_memo_token = stripe_memo.open_scope()
+
+    @app.teardown_request
+    def close_stripe_memo(exc):
+        token = g.pop('stripe_memo_token', None)
+        if token is not None:
+            stripe_memo.close_scope(token)
+
     return app
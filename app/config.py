@@ -11,6 +11,7 @@ load_dotenv()
 
 class Config:
     SNS_CLIENT = boto3.client('sns')    
+    SES_CLIENT = boto3.client('ses')
     COGNITO_CLIENT = boto3.client('cognito-idp', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
     USER_POOL_ID = os.environ.get('USER_POOL_ID', 'us-east-1_zudeUTI1c')
     AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
@@ -27,10 +28,24 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
+    # Stripe HTTP transport (see app/util/stripe_client.py)
+    STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')  # e.g. http://localhost:12111 for stripe-mock
+    STRIPE_HTTP_POOL_CONNECTIONS = int(os.environ.get('STRIPE_HTTP_POOL_CONNECTIONS', 4))
+    STRIPE_HTTP_POOL_MAXSIZE = int(os.environ.get('STRIPE_HTTP_POOL_MAXSIZE', 32))
+    STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 3.05))
+    STRIPE_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', 20))
+    STRIPE_MAX_NETWORK_RETRIES = int(os.environ.get('STRIPE_MAX_NETWORK_RETRIES', 2))
+    # Bounded thread pool for concurrent independent Stripe calls (app/util/fanout.py)
+    FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', 16))
+    FANOUT_TIMEOUT_SECONDS = float(os.environ.get('FANOUT_TIMEOUT_SECONDS', 25))
+    # How long Balance/Account lookups are shared between dashboard requests
+    ACCOUNT_CACHE_TTL_SECONDS = float(os.environ.get('ACCOUNT_CACHE_TTL_SECONDS', 10))
     SWAGGER_UI_DOC_EXPANSION = 'list'
     RESTX_MASK_SWAGGER = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = os.environ.get('SQLALCHEMY_TRACK_MODIFICATIONS') == 'True'
+    # Serve finance reporting endpoints from the local SQL ledger (run backfill_ledger.py first)
+    LEDGER_READS_ENABLED = os.environ.get('LEDGER_READS_ENABLED') == 'True'
     FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
     STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
     STRIPE_SUCCESS_URL = os.environ.get('STRIPE_SUCCESS_URL', f"{FRONTEND_URL}/dashboard")
@@ -40,6 +55,40 @@ class Config:
     CHECKOUT_STARTED_SNS = os.environ.get('CHECKOUT_STARTED_SNS', 'arn:aws:sns:us-east-1:609717032481:StripeCheckoutStarted')
     USERS_TABLE = DYNAMODB_RESOURCE.Table('Users')
     PLANS_TABLE = DYNAMODB_RESOURCE.Table(os.environ.get('PLANS_TABLE', 'Plans'))
+    COUPONS_TABLE = DYNAMODB_RESOURCE.Table(os.environ.get('COUPONS_TABLE', 'Coupons'))
+    # GSI on Users keyed by the normalized (lowercased) email
+    USERS_EMAIL_INDEX = os.environ.get('USERS_EMAIL_INDEX', 'emailLower-index')
+    # GSI on Users keyed by stripeCustomerId, used to resolve webhook events to users
+    USERS_CUSTOMER_INDEX = os.environ.get('USERS_CUSTOMER_INDEX', 'stripeCustomerId-index')
+    # Parallel Segment/TotalSegments count for admin and maintenance table walks
+    DYNAMODB_SCAN_SEGMENTS = int(os.environ.get('DYNAMODB_SCAN_SEGMENTS', 4))
+    # How long a worker's plan/coupon catalog (and the Redis snapshot) is trusted before reloading
+    PLAN_CATALOG_TTL_SECONDS = int(os.environ.get('PLAN_CATALOG_TTL_SECONDS', 300))
+    # Upper bound on how long cached Stripe Product/Price objects live (webhooks refresh them sooner)
+    STRIPE_CATALOG_CACHE_TTL_SECONDS = int(os.environ.get('STRIPE_CATALOG_CACHE_TTL_SECONDS', 3600))
+    # How long a cached userId -> Stripe customer id link lives in Redis (the Users table is authoritative)
+    CUSTOMER_INDEX_CACHE_TTL_SECONDS = int(os.environ.get('CUSTOMER_INDEX_CACHE_TTL_SECONDS', 86400))
+    # Acknowledge webhooks as soon as they are queued and run handlers in webhook_worker.py
+    WEBHOOK_ASYNC_INGEST = os.environ.get('WEBHOOK_ASYNC_INGEST') == 'True'
+    # Worker threads started by webhook_worker.py
+    WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+    # Webhook streams events are spread over by customer id; each is worked by one thread at a time
+    WEBHOOK_PARTITIONS = int(os.environ.get('WEBHOOK_PARTITIONS', 16))
+    # How long queued events are held so a slightly late, older event of the same partition is applied first
+    WEBHOOK_REORDER_WINDOW_MS = int(os.environ.get('WEBHOOK_REORDER_WINDOW_MS', 2000))
+    # Handler attempts for a failing event before it is moved to the dead-letter stream
+    WEBHOOK_MAX_DELIVERIES = int(os.environ.get('WEBHOOK_MAX_DELIVERIES', 5))
+    # How long a partition waits before retrying a failed event
+    WEBHOOK_RETRY_IDLE_MS = int(os.environ.get('WEBHOOK_RETRY_IDLE_MS', 60000))
+    # How long a webhook event id stays claimed by the worker handling it (must exceed the slowest handler)
+    WEBHOOK_PROCESSING_TTL_SECONDS = int(os.environ.get('WEBHOOK_PROCESSING_TTL_SECONDS', 600))
+    # How long handled event ids are remembered; covers Stripe's 3 days of delivery retries and the
+    # 30 days of events replay_events.py can list, so a replay does not re-run handled events
+    WEBHOOK_DONE_TTL_SECONDS = int(os.environ.get('WEBHOOK_DONE_TTL_SECONDS', 31 * 86400))
+    # How often the webhook-maintained subscription status counters are rebuilt from Stripe
+    MEMBERSHIP_STATS_RECONCILE_SECONDS = int(os.environ.get('MEMBERSHIP_STATS_RECONCILE_SECONDS', 86400))
+    # How long a canceled subscription's tombstone guards the counters against late events (Stripe retries for 3 days)
+    MEMBERSHIP_STATS_TOMBSTONE_SECONDS = int(os.environ.get('MEMBERSHIP_STATS_TOMBSTONE_SECONDS', 7 * 86400))
 
     ACCESS_TOKEN_EXPIRES = 180  # 15 min
     REFRESH_TOKEN_EXPIRES = 2592000  # 30 days
@@ -0,0 +1,74 @@
+from app.models.user import db
+
+# Local copies of Stripe finance objects, kept current from webhook events.
+# `raw` holds the Stripe object as received so endpoints can return the same
+# shape Stripe would; `synced_at` is the event (or fetch) time of that copy and
+# stops an older event from overwriting a newer one.
+
+
+class LedgerCharge(db.Model):
+    __tablename__ = 'ledger_charge'
+    id = db.Column(db.String(64), primary_key=True)
+    customer_id = db.Column(db.String(64))
+    amount = db.Column(db.Integer, nullable=False)
+    amount_refunded = db.Column(db.Integer, nullable=False, default=0)
+    currency = db.Column(db.String(8), nullable=False)
+    status = db.Column(db.String(32))
+    paid = db.Column(db.Boolean)
+    refunded = db.Column(db.Boolean)
+    invoice_id = db.Column(db.String(64))
+    created = db.Column(db.Integer, nullable=False, index=True)
+    synced_at = db.Column(db.Integer, nullable=False)
+    raw = db.Column(db.JSON, nullable=False)
+    __table_args__ = (
+        db.Index('ix_ledger_charge_customer_created', 'customer_id', 'created'),
+    )
+
+
+class LedgerRefund(db.Model):
+    __tablename__ = 'ledger_refund'
+    id = db.Column(db.String(64), primary_key=True)
+    charge_id = db.Column(db.String(64), index=True)
+    customer_id = db.Column(db.String(64))
+    amount = db.Column(db.Integer, nullable=False)
+    currency = db.Column(db.String(8), nullable=False)
+    status = db.Column(db.String(32))
+    reason = db.Column(db.String(64))
+    created = db.Column(db.Integer, nullable=False, index=True)
+    synced_at = db.Column(db.Integer, nullable=False)
+    raw = db.Column(db.JSON, nullable=False)
+    __table_args__ = (
+        db.Index('ix_ledger_refund_customer_created', 'customer_id', 'created'),
+    )
+
+
+class LedgerPayout(db.Model):
+    __tablename__ = 'ledger_payout'
+    id = db.Column(db.String(64), primary_key=True)
+    amount = db.Column(db.Integer, nullable=False)
+    currency = db.Column(db.String(8), nullable=False)
+    status = db.Column(db.String(32))
+    arrival_date = db.Column(db.Integer)
+    created = db.Column(db.Integer, nullable=False, index=True)
+    synced_at = db.Column(db.Integer, nullable=False)
+    raw = db.Column(db.JSON, nullable=False)
+
+
+class LedgerInvoice(db.Model):
+    __tablename__ = 'ledger_invoice'
+    id = db.Column(db.String(64), primary_key=True)
+    customer_id = db.Column(db.String(64))
+    subscription_id = db.Column(db.String(64))
+    number = db.Column(db.String(64))
+    status = db.Column(db.String(32))
+    amount_due = db.Column(db.Integer)
+    amount_paid = db.Column(db.Integer)
+    currency = db.Column(db.String(8))
+    hosted_invoice_url = db.Column(db.Text)
+    invoice_pdf = db.Column(db.Text)
+    created = db.Column(db.Integer, nullable=False, index=True)
+    synced_at = db.Column(db.Integer, nullable=False)
+    raw = db.Column(db.JSON, nullable=False)
+    __table_args__ = (
+        db.Index('ix_ledger_invoice_customer_created', 'customer_id', 'created'),
+    )
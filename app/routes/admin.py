@@ -6,11 +6,15 @@ from flask import request, g
 from app.decorators.token_required import token_required
 import stripe
 from app.config import Config
+from app.util.dynamo_scan import scan_all
+from app.util.dynamo_batch import batch_get_items
+from app.util.plan_catalog import plan_catalog
+from app.util.notification_outbox import outbox_depth
+from app.util.webhook_queue import queue_depth
 
 # Stripe + DynamoDB clients
-stripe.api_key = Config.STRIPE_SECRET_KEY
-plans_table = Config.DYNAMODB_RESOURCE.Table("Plans")
-coupons_table = Config.DYNAMODB_RESOURCE.Table("Coupons")
+plans_table = Config.PLANS_TABLE
+coupons_table = Config.COUPONS_TABLE
 
 admin_ns = Namespace("admin", description="Admin operations")
 
@@ -106,6 +110,7 @@ class UpdatePlan(Resource):
                 UpdateExpression="SET " + ", ".join(update_expr),
                 ExpressionAttributeValues=expr_values
             )
+            plan_catalog.publish_change()
 
             return {"message": f"Plan {plan_id} updated successfully"}, 200
 
@@ -175,6 +180,7 @@ class AddPlan(Resource):
                 "updatedBy": g.user if hasattr(g, "user") else "system",
                 "updatedDate": timestamp
             })
+            plan_catalog.publish_change()
 
             return {"message": "Plan created successfully", "planId": plan_id}, 201
 
@@ -263,6 +269,7 @@ class SetCoupon(Resource):
                         ":ts": timestamp
                     }
                 )
+                plan_catalog.publish_change()
                 return {"message": f"Coupon {coupon_id} linked to Plan {plan_id}"}, 200
             else:
                 # Unlink coupon
@@ -275,6 +282,7 @@ class SetCoupon(Resource):
                         ":ts": timestamp
                     }
                 )
+                plan_catalog.publish_change()
                 return {"message": f"Coupon unlinked from Plan {plan_id}"}, 200
 
         except Exception as e:
@@ -286,16 +294,15 @@ class PlansWithCoupons(Resource):
     @admin_required
     def get(self):
         try:
-            # 1. Scan all plans
-            plans_response = plans_table.scan()
-            plans = plans_response.get("Items", [])
+            # 1. Scan all plans (every page)
+            plans = list(scan_all(plans_table))
 
-            # 2. For each plan, fetch coupon details if couponId exists
+            # 2. Fetch every linked coupon in batches and join them in memory
+            coupons = batch_get_items(coupons_table, "couponId", [plan.get("couponId") for plan in plans])
             for plan in plans:
                 coupon_id = plan.get("couponId")
                 if coupon_id:
-                    coupon_response = coupons_table.get_item(Key={"couponId": coupon_id})
-                    plan["couponDetails"] = coupon_response.get("Item", {})
+                    plan["couponDetails"] = coupons.get(coupon_id, {})
                 else:
                     plan["couponDetails"] = None
 
@@ -345,3 +352,20 @@ class UpdateCoupon(Resource):
 
         except Exception as e:
             return {"error": str(e)}, 400
+
+
+# -------------------------
+# Background queue depths (notification outbox, queued webhook events)
+# -------------------------
+@admin_ns.route("/queue-depth")
+class QueueDepth(Resource):
+    @admin_ns.doc(params={'Authorization': {'in': 'header', 'description': 'Bearer <JWT>', 'required': True}})
+    @admin_required
+    def get(self):
+        try:
+            return {
+                "notificationOutbox": outbox_depth(),
+                "webhookEvents": queue_depth(),
+            }, 200
+        except Exception as e:
+            return {"error": str(e)}, 400
@@ -21,20 +21,24 @@ import os
 from botocore.exceptions import ClientError
 from app.config import Config
 
-stripe.api_key = Config.STRIPE_SECRET_KEY
 SNS_TOPIC_ARN = os.environ.get("CHECKOUT_STARTED_SNS", "arn:aws:sns:us-east-1:609717032481:StripeCheckoutStarted")
 sns_client = boto3.client("sns", region_name="us-east-1")
 
 
 api_ns = Namespace('api', description='General user APIs')
 from app.util.stripe_utils import (
-    find_user_by_email_case_insensitive,
     find_plan_by_id_case_insensitive,
     ensure_stripe_customer,
     build_checkout_session_params,
-    get_stripe_customer_id_by_email,
     send_failure_sns
 )
+from app.util.checkout_sessions import get_open_session, remember_session, checkout_idempotency_key
+from app.util.users_repository import (
+    users_repository,
+    USER_CHECKOUT_ATTRIBUTES,
+    USER_DETAILS_ATTRIBUTES,
+    USER_SUBSCRIPTION_ATTRIBUTES,
+)
 create_checkout_model = api_ns.model('CreateCheckout', {
     'planId': fields.String(required=True, description='UI-friendly plan name'),
 })
@@ -53,7 +57,7 @@ class CreateCheckout(Resource):
             plan_id = data.get("planId")
             if not (user_id and email and plan_id):
                 return {"error": "Missing parameters"}, 400
-            user_item = find_user_by_email_case_insensitive(email)
+            user_item = users_repository.get_by_email(email, USER_CHECKOUT_ATTRIBUTES)
             if user_item:
                 payment_status = str(user_item.get("paymentStatus", "")).lower()
                 subscription_status = str(user_item.get("subscriptionStatus", "")).lower()
@@ -65,6 +69,10 @@ class CreateCheckout(Resource):
                 return {"error": "Invalid planId"}, 404
             price_id = plan_item["stripePriceId"]
             print(price_id)
+            open_session = get_open_session(user_id, price_id)
+            if open_session:
+                print(f"Reusing open checkout session {open_session['sessionId']} for user {email}")
+                return {"sessionId": open_session["sessionId"], "url": open_session["url"], "stripeCustomerId": open_session["stripeCustomerId"]}, 200
             try:
                 stripe_customer_id = ensure_stripe_customer(user_item, email, user_id)
             except Exception as e:
@@ -76,8 +84,12 @@ class CreateCheckout(Resource):
             session_params["customer_update"] = {"shipping": "auto"}
             print("Checkout session params:", session_params)
             try:
-                session = stripe.checkout.Session.create(**session_params)
+                session = stripe.checkout.Session.create(
+                    **session_params,
+                    idempotency_key=checkout_idempotency_key(user_id, price_id)
+                )
                 print("Created checkout session:", session)
+                remember_session(user_id, price_id, session, stripe_customer_id)
                 return {"sessionId": session.id, "url": session.url, "stripeCustomerId": stripe_customer_id}, 200
             except Exception as e:
                 print("Stripe checkout error:", str(e))
@@ -100,13 +112,9 @@ class UserDetails(Resource):
         if not email:
             return {'error': 'Email or username not found in token'}, 400
         # Fetch user details from DynamoDB Users table using email
-        response = users_table.scan(
-            FilterExpression=Attr("email").eq(email)
-        )
-        items = response.get("Items", [])
-        if not items:
+        user = users_repository.get_by_email(email, USER_DETAILS_ATTRIBUTES)
+        if not user:
             return {'error': 'User not found'}, 404
-        user = items[0]
         user_details = {
             'name': user.get('name'),
             'email': user.get('email'),
@@ -126,12 +134,7 @@ class CancelSubscription(Resource):
         if not email:
             return {"error": "Email not found in token"}, 400
         # Find user by case-insensitive email
-        user_resp = users_table.scan()
-        user_item = None
-        for item in user_resp.get("Items", []):
-            if item.get("email", "").lower() == email.lower():
-                user_item = item
-                break
+        user_item = users_repository.get_by_email(email, USER_SUBSCRIPTION_ATTRIBUTES)
         if not user_item:
             return {"error": "User not found"}, 404
         stripe_subscription_id = user_item.get("stripeSubscriptionId")
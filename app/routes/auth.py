@@ -14,6 +14,8 @@ import uuid
 import stripe
 from app.util.auth_utils import verify_app_jwt
 from app.util.cognito_logout import cognito_global_logout
+from app.util.users_repository import users_repository, normalize_email, USER_CUSTOMER_ATTRIBUTES, USER_GROUPS_ATTRIBUTES
+from app.util.customer_index import link_customer
 
 
 from app.util.auth_utils import create_access_token, create_refresh_token, verify_cognito_id_token
@@ -141,12 +143,10 @@ class Login(Resource):
         print("User email:", email)
         print("User ID:", user_id)
         # --- Stripe customer check/create ---
-        users_table = Config.USERS_TABLE
-        user_item = users_table.get_item(Key={"userId": user_id}).get("Item")
+        user_item = users_repository.get_by_user_id(user_id, USER_CUSTOMER_ATTRIBUTES)
         stripe_customer_id = user_item.get("stripeCustomerId") if user_item else None
 
         if not stripe_customer_id:
-            stripe.api_key = Config.STRIPE_SECRET_KEY
             stripe_customer = stripe.Customer.create(
                 email=email,
                 name=name if name else None,
@@ -154,12 +154,11 @@ class Login(Resource):
                 metadata={"cognitoUserId": user_id}
             )
             stripe_customer_id = stripe_customer["id"]
-            # Store in DynamoDB
-            users_table.update_item(
-                Key={"userId": user_id},
-                UpdateExpression="SET stripeCustomerId=:c",
-                ExpressionAttributeValues={":c": stripe_customer_id}
-            )
+            # Store in DynamoDB and the customer index cache
+            link_customer(user_id, stripe_customer_id, email)
+        elif email and user_item.get("emailLower") != normalize_email(email):
+            # Keep the emailLower GSI key in sync for users created elsewhere
+            users_repository.set_email_lower(user_id, email)
         print("Stripe customer ID:", stripe_customer_id)
         # --- Issue app tokens ---
         extra = {"roles": groups}
@@ -264,7 +263,7 @@ class Refresh(Resource):
             cognito_token = json.loads(value).get("cognito_token")
 
             # Get user roles/groups from DynamoDB
-            user_item = Config.USERS_TABLE.get_item(Key={"userId": user_id}).get("Item")
+            user_item = users_repository.get_by_user_id(user_id, USER_GROUPS_ATTRIBUTES)
             groups = user_item.get("groups", []) if user_item else []
             extra = {"roles": groups}
 
@@ -6,7 +6,6 @@ from flask import request
 import stripe
 from app.config import Config
 
-stripe.api_key = Config.STRIPE_SECRET_KEY
 
 membership_ns = Namespace('membership', description='Membership related operations')
 
@@ -15,10 +14,26 @@ import stripe
 from flask import request
 from flask_restx import Namespace, Resource, fields
 from app.config import Config
-from datetime import datetime
+import itertools
+import functools
+from app.util.stripe_pagination import PAGINATION_DOC_PARAMS, pagination_args, paginated_list, list_page, iter_all, stream_ndjson
+from app.util.stripe_catalog_cache import get_catalog_object, list_catalog_page, cache_catalog_object
+from app.util.subscription_stats import get_status_counts, reconcile_status_counts, schedule_reconcile_if_stale
+from app.util.transaction_query import created_range, iter_customer_refunds, query_customer_transactions
+from app.util.ledger import ledger_list_page, ledger_customer_refunds, ledger_customer_transactions, get_invoice, InvalidCursor
+from app.models.ledger import LedgerCharge, LedgerRefund, LedgerPayout, LedgerInvoice
+from app.util.fanout import fan_out
+from app.util.account_cache import get_balance, get_account
+from app.util.customer_index import get_customer_id
+from app.util.users_repository import users_repository
 
 membership_ns = Namespace('membership', description='Membership and subscription operations')
 
+
+@membership_ns.errorhandler(InvalidCursor)
+def handle_invalid_cursor(error):
+    return {'message': str(error)}, 400
+
 subscription_model = membership_ns.model('Subscription', {
     'stripe_customer_id': fields.String(required=True, description='Stripe customer ID'),
     'price_id': fields.String(required=True, description='Stripe Price ID for the plan'),
@@ -139,7 +154,6 @@ class StartSubscription(Resource):
     def post(self):
         """Start a subscription for a user"""
         data = request.json
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         customer_id = data.get('stripe_customer_id')
         price_id = data.get('price_id')
         trial_days = data.get('trial_period_days')
@@ -172,11 +186,11 @@ class CreateProduct(Resource):
     def post(self):
         """Create a Stripe Product (admin only)"""
         data = request.json
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         product = stripe.Product.create(
             name=data['name'],
             description=data.get('description', '')
         )
+        cache_catalog_object(product)
         return {'product_id': product['id'], 'name': product['name']}, 201
 
 @membership_ns.route('/create-price')
@@ -185,13 +199,13 @@ class CreatePrice(Resource):
     def post(self):
         """Create a Stripe Price for a Product (admin only)"""
         data = request.json
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         price = stripe.Price.create(
             product=data['product_id'],
             unit_amount=data['unit_amount'],
             currency=data['currency'],
             recurring={'interval': data['recurring_interval']}
         )
+        cache_catalog_object(price)
         return {'price_id': price['id'], 'unit_amount': price['unit_amount'], 'currency': price['currency']}, 201
 
 @membership_ns.route('/create-checkout-session')
@@ -200,7 +214,6 @@ class CreateCheckoutSession(Resource):
     def post(self):
         """Create a Stripe Checkout Session for subscription payment. If no stripe_customer_id, create customer first."""
         data = request.json
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         customer_id = data.get('stripe_customer_id')
         # If no customer_id, create a new Stripe customer using email/username
         if not customer_id:
@@ -237,7 +250,6 @@ class CreateCheckoutSessionWithTrial(Resource):
     def post(self):
         """Create a Stripe Checkout Session for subscription with trial and optional fields"""
         data = request.json
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         line_items = [{
             'price': data['price_id'],
             'quantity': data.get('quantity', 1)
@@ -271,31 +283,32 @@ class CreateCheckoutSessionWithTrial(Resource):
 
 @membership_ns.route('/products')
 class ListProducts(Resource):
+    @membership_ns.doc(params=PAGINATION_DOC_PARAMS)
     def get(self):
-        """List all Stripe products"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        products = stripe.Product.list(limit=100)
-        return {'products': products['data']}
+        """List Stripe products (cursor-paginated and cached, or every page as NDJSON with stream=true)"""
+        args = pagination_args()
+        if args['stream']:
+            return paginated_list(stripe.Product.list, 'products')
+        return list_catalog_page('product', args['limit'], args['starting_after'])
 
 @membership_ns.route('/prices')
 class ListPrices(Resource):
+    @membership_ns.doc(params=PAGINATION_DOC_PARAMS)
     def get(self):
-        """List all Stripe prices"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        prices = stripe.Price.list(limit=100)
-        return {'prices': prices['data']}
+        """List Stripe prices (cursor-paginated and cached, or every page as NDJSON with stream=true)"""
+        args = pagination_args()
+        if args['stream']:
+            return paginated_list(stripe.Price.list, 'prices')
+        return list_catalog_page('price', args['limit'], args['starting_after'])
 
 @membership_ns.route('/product/<string:product_id>')
 class ProductDetail(Resource):
     def get(self, product_id):
         """Get details of a specific Stripe product"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        product = stripe.Product.retrieve(product_id)
-        return product
+        return get_catalog_object('product', product_id)
     @membership_ns.expect(update_product_model)
     def put(self, product_id):
         """Update a Stripe product's name, description, and active status"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         data = request.json
         update_fields = {}
         if 'name' in data:
@@ -305,6 +318,7 @@ class ProductDetail(Resource):
         if 'active' in data:
             update_fields['active'] = data['active']
         updated = stripe.Product.modify(product_id, **update_fields)
+        cache_catalog_object(updated)
         return {
             'product_id': updated['id'],
             'name': updated.get('name'),
@@ -313,21 +327,18 @@ class ProductDetail(Resource):
         }
     def delete(self, product_id):
         """Deactivate (soft-delete) a Stripe product"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         deleted = stripe.Product.modify(product_id, active=False)
+        cache_catalog_object(deleted)
         return {'deleted': deleted['id'], 'active': deleted['active']}
 
 @membership_ns.route('/price/<string:price_id>')
 class PriceDetail(Resource):
     def get(self, price_id):
         """Get details of a specific Stripe price"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        price = stripe.Price.retrieve(price_id)
-        return price
+        return get_catalog_object('price', price_id)
     @membership_ns.expect(update_price_model)
     def put(self, price_id):
         """Update a Stripe price's nickname and active status (other fields cannot be changed)"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         data = request.json
         update_fields = {}
         if 'nickname' in data:
@@ -335,6 +346,7 @@ class PriceDetail(Resource):
         if 'active' in data:
             update_fields['active'] = data['active']
         updated = stripe.Price.modify(price_id, **update_fields)
+        cache_catalog_object(updated)
         return {
             'price_id': updated['id'],
             'nickname': updated.get('nickname'),
@@ -342,8 +354,8 @@ class PriceDetail(Resource):
         }
     def delete(self, price_id):
         """Deactivate a Stripe price (cannot delete, only deactivate)"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         deactivated = stripe.Price.modify(price_id, active=False)
+        cache_catalog_object(deactivated)
         return {'price_id': deactivated['id'], 'active': deactivated['active']}
 
 @membership_ns.route('/customer-id')
@@ -353,48 +365,43 @@ class GetCustomerId(Resource):
         'email': {'description': 'User email', 'in': 'query', 'type': 'string'}
     })
     def get(self):
-        """Get Stripe customer ID from username or email"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
+        """Get Stripe customer ID from username or email (through the customer index)"""
         username = request.args.get('username')
         email = request.args.get('email')
-        query = {}
-        if email:
-            query['email'] = email
-        customers = stripe.Customer.list(limit=100, **query)
         if username:
-            filtered = [c for c in customers['data'] if c.get('metadata', {}).get('user_id') == username]
+            stripe_customer_id = get_customer_id(username)
+        elif email:
+            stripe_customer_id = users_repository.get_stripe_customer_id_by_email(email)
+            if not stripe_customer_id:
+                # Customers created outside this app have no Users item; Stripe filters by email server-side
+                customers = stripe.Customer.list(email=email, limit=1)
+                stripe_customer_id = customers['data'][0]['id'] if customers['data'] else None
         else:
-            filtered = customers['data']
-        if filtered:
-            return {'stripe_customer_id': filtered[0]['id']}
+            return {'message': 'username or email required'}, 400
+        if stripe_customer_id:
+            return {'stripe_customer_id': stripe_customer_id}
         return {'message': 'Customer not found'}, 404
 
 @membership_ns.route('/membership-stats')
 class MembershipStats(Resource):
+    @membership_ns.doc(params={
+        'fresh': {'description': 'If true, walk every Stripe subscription instead of reading the webhook-maintained counters', 'in': 'query', 'type': 'boolean'}
+    })
     def get(self):
-        """Get count of users by Stripe subscription status (all statuses, paginated)"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        status_counts = {}
-        has_more = True
-        starting_after = None
-        while has_more:
-            params = {'limit': 100}
-            if starting_after:
-                params['starting_after'] = starting_after
-            subs = stripe.Subscription.list(**params)
-            for sub in subs['data']:
-                status = sub['status']
-                status_counts[status] = status_counts.get(status, 0) + 1
-            has_more = subs['has_more']
-            if has_more:
-                starting_after = subs['data'][-1]['id']
+        """Get count of users by Stripe subscription status (counters kept current by webhooks)"""
+        if request.args.get('fresh', '').lower() in ('1', 'true', 'yes'):
+            return reconcile_status_counts()
+        status_counts = get_status_counts()
+        if status_counts is None:
+            # Counters have never been built: do the first full walk inline
+            return reconcile_status_counts()
+        schedule_reconcile_if_stale()
         return status_counts
 
 @membership_ns.route('/checkout-session/<string:session_id>')
 class CheckoutSessionStatus(Resource):
     def get(self, session_id):
         """Retrieve Stripe Checkout Session and payment status"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         session = stripe.checkout.Session.retrieve(session_id)
         return {
             'id': session['id'],
@@ -410,7 +417,6 @@ class ManageSubscription(Resource):
     @membership_ns.expect(manage_subscription_model)
     def post(self, subscription_id):
         """Cancel, pause, or resume a Stripe subscription"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         data = request.json
         result = {}
         if data.get('pause'):
@@ -431,23 +437,24 @@ class ManageSubscription(Resource):
 @membership_ns.route('/invoices')
 class UserInvoices(Resource):
     @membership_ns.doc(params={
-        'stripe_customer_id': {'description': 'Stripe customer ID', 'in': 'query', 'type': 'string'}
+        'stripe_customer_id': {'description': 'Stripe customer ID', 'in': 'query', 'type': 'string'},
+        **PAGINATION_DOC_PARAMS
     })
     def get(self):
-        """Get invoice details for a Stripe customer"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
+        """Get invoice details for a Stripe customer (cursor-paginated, or NDJSON with stream=true)"""
         customer_id = request.args.get('stripe_customer_id')
         if not customer_id:
             return {'message': 'stripe_customer_id required'}, 400
-        invoices = stripe.Invoice.list(customer=customer_id, limit=100)
-        return {'invoices': invoices['data']}
+        args = pagination_args()
+        if Config.LEDGER_READS_ENABLED and not args['stream']:
+            return ledger_list_page(LedgerInvoice, 'invoices', args['limit'], args['starting_after'], customer_id=customer_id)
+        return paginated_list(stripe.Invoice.list, 'invoices', customer=customer_id)
 
 @membership_ns.route('/invoice/<string:invoice_id>/pdf')
 class DownloadInvoicePDF(Resource):
     def get(self, invoice_id):
-        """Download Stripe invoice as PDF by invoice ID"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        invoice = stripe.Invoice.retrieve(invoice_id)
+        """Download Stripe invoice as PDF by invoice ID (served from the invoice mirror)"""
+        invoice = get_invoice(invoice_id)
         pdf_url = invoice.get('invoice_pdf')
         if not pdf_url:
             return {'message': 'PDF not available for this invoice'}, 404
@@ -457,8 +464,7 @@ class DownloadInvoicePDF(Resource):
 class AccountBalance(Resource):
     def get(self):
         """Retrieve Stripe account balance (available vs pending)"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        balance = stripe.Balance.retrieve()
+        balance = get_balance()
         return {
             'available': balance['available'],
             'pending': balance['pending']
@@ -471,9 +477,8 @@ class AccountTotalBalance(Resource):
     })
     def get(self):
         """Show total Stripe account balance in selected currency"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         currency = request.args.get('currency', 'usd').lower()
-        balance = stripe.Balance.retrieve()
+        balance = get_balance()
         total = 0
         for entry in balance['available']:
             if entry['currency'] == currency:
@@ -488,32 +493,60 @@ class AccountTotalBalance(Resource):
 
 @membership_ns.route('/account/payouts')
 class AccountPayouts(Resource):
+    @membership_ns.doc(params=PAGINATION_DOC_PARAMS)
     def get(self):
-        """List Stripe account payouts"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        payouts = stripe.Payout.list(limit=100)
-        return {'payouts': payouts['data']}
+        """List Stripe account payouts (cursor-paginated, or NDJSON with stream=true)"""
+        args = pagination_args()
+        if Config.LEDGER_READS_ENABLED and not args['stream']:
+            return ledger_list_page(LedgerPayout, 'payouts', args['limit'], args['starting_after'])
+        return paginated_list(stripe.Payout.list, 'payouts')
 
 @membership_ns.route('/account/transactions')
 class AccountTransactions(Resource):
+    @membership_ns.doc(params={
+        'limit': PAGINATION_DOC_PARAMS['limit'],
+        'charges_starting_after': {'description': 'Cursor for the charges list', 'in': 'query', 'type': 'string'},
+        'refunds_starting_after': {'description': 'Cursor for the refunds list', 'in': 'query', 'type': 'string'},
+        'payouts_starting_after': {'description': 'Cursor for the payouts list', 'in': 'query', 'type': 'string'},
+        'stream': {'description': 'If true, stream every charge, refund and payout as NDJSON', 'in': 'query', 'type': 'boolean'},
+    })
     def get(self):
-        """List Stripe account transactions (charges, refunds, payouts)"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        charges = stripe.Charge.list(limit=100)
-        refunds = stripe.Refund.list(limit=100)
-        payouts = stripe.Payout.list(limit=100)
-        return {
-            'charges': charges['data'],
-            'refunds': refunds['data'],
-            'payouts': payouts['data']
-        }
+        """List Stripe account transactions (charges, refunds, payouts), each with its own cursor"""
+        args = pagination_args()
+        collections = [
+            ('charges', stripe.Charge.list, LedgerCharge),
+            ('refunds', stripe.Refund.list, LedgerRefund),
+            ('payouts', stripe.Payout.list, LedgerPayout),
+        ]
+        if args['stream']:
+            # Each line carries Stripe's own "object" field (charge/refund/payout)
+            return stream_ndjson(itertools.chain.from_iterable(
+                iter_all(list_fn, starting_after=request.args.get(f'{key}_starting_after')) for key, list_fn, _ in collections
+            ))
+        if Config.LEDGER_READS_ENABLED:
+            pages = {
+                key: ledger_list_page(ledger_model, key, args['limit'], request.args.get(f'{key}_starting_after'))
+                for key, _, ledger_model in collections
+            }
+        else:
+            # The three Stripe lists are independent: fetch them concurrently
+            pages = fan_out({
+                key: functools.partial(list_page, list_fn, key, limit=args['limit'], starting_after=request.args.get(f'{key}_starting_after'))
+                for key, list_fn, _ in collections
+            })
+        result = {}
+        for key, _, _ in collections:
+            page = pages[key]
+            result[key] = page[key]
+            result[f'{key}_has_more'] = page['has_more']
+            result[f'{key}_next_starting_after'] = page['next_starting_after']
+        return result
 
 @membership_ns.route('/account/pending-availability')
 class PendingAvailability(Resource):
     def get(self):
         """Show estimated availability dates for pending funds"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        balance = stripe.Balance.retrieve()
+        balance = get_balance()
         pending_info = []
         for entry in balance['pending']:
             pending_info.append({
@@ -528,8 +561,7 @@ class PendingAvailability(Resource):
 class PayoutSchedule(Resource):
     def get(self):
         """Show Stripe account payout schedule settings"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        account = stripe.Account.retrieve()
+        account = get_account()
         payout_schedule = account.get('settings', {}).get('payouts', {})
         return {'payout_schedule': payout_schedule}
 
@@ -538,7 +570,6 @@ class Refund(Resource):
     @membership_ns.expect(refund_model)
     def post(self):
         """Refund money to a customer for a charge"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
         data = request.json
         refund_params = {
             'charge': data['charge_id']
@@ -553,53 +584,54 @@ class Refund(Resource):
 @membership_ns.route('/charges')
 class ListCharges(Resource):
     @membership_ns.doc(params={
-        'stripe_customer_id': {'description': 'Stripe customer ID', 'in': 'query', 'type': 'string'}
+        'stripe_customer_id': {'description': 'Stripe customer ID', 'in': 'query', 'type': 'string'},
+        **PAGINATION_DOC_PARAMS
     })
     def get(self):
-        """List charges for a Stripe customer to get charge IDs"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
+        """List charges for a Stripe customer to get charge IDs (cursor-paginated, or NDJSON with stream=true)"""
         customer_id = request.args.get('stripe_customer_id')
         if not customer_id:
             return {'message': 'stripe_customer_id required'}, 400
-        charges = stripe.Charge.list(customer=customer_id, limit=100)
-        return {'charges': charges['data']}
+        args = pagination_args()
+        if Config.LEDGER_READS_ENABLED and not args['stream']:
+            return ledger_list_page(LedgerCharge, 'charges', args['limit'], args['starting_after'], customer_id=customer_id)
+        return paginated_list(stripe.Charge.list, 'charges', customer=customer_id)
 
 @membership_ns.route('/customer/<string:customer_id>/transactions')
 class CustomerTransactions(Resource):
     @membership_ns.doc(params={
         'start_date': {'description': 'Start date (YYYY-MM-DD)', 'in': 'query', 'type': 'string'},
         'end_date': {'description': 'End date (YYYY-MM-DD)', 'in': 'query', 'type': 'string'},
-        'type': {'description': 'Transaction type (charge, refund)', 'in': 'query', 'type': 'string'}
+        'type': {'description': 'Transaction type (charge, refund)', 'in': 'query', 'type': 'string'},
+        'limit': {'description': 'Window size (1-100, default 10)', 'in': 'query', 'type': 'integer'},
+        'offset': {'description': 'Number of newer transactions to skip (default 0)', 'in': 'query', 'type': 'integer'}
     })
     def get(self, customer_id):
-        """Get last 10 transactions for a customer, filter by date or type"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
+        """Get a customer's transactions newest first, filtered by date or type, one window at a time"""
         tx_type = request.args.get('type')
-        charges = stripe.Charge.list(customer=customer_id, limit=100)
-        refunds = stripe.Refund.list(limit=100)
-        filtered_charges = charges['data']
-        filtered_refunds = refunds['data']
-        if start_date:
-            start_ts = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
-            filtered_charges = [c for c in filtered_charges if c['created'] >= start_ts]
-            filtered_refunds = [r for r in filtered_refunds if r['created'] >= start_ts]
-        if end_date:
-            end_ts = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp())
-            filtered_charges = [c for c in filtered_charges if c['created'] <= end_ts]
-            filtered_refunds = [r for r in filtered_refunds if r['created'] <= end_ts]
-        if tx_type == 'charge':
-            return {'charges': filtered_charges[:10]}
-        elif tx_type == 'refund':
-            customer_refunds = [r for r in filtered_refunds if r.get('charge') in [c['id'] for c in filtered_charges]]
-            return {'refunds': customer_refunds[:10]}
+        if tx_type not in ('charge', 'refund'):
+            tx_type = None
+        try:
+            limit = max(1, min(int(request.args.get('limit', 10)), 100))
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return {'message': 'limit and offset must be integers'}, 400
+        created = created_range(request.args.get('start_date'), request.args.get('end_date'))
+        if Config.LEDGER_READS_ENABLED:
+            transactions, has_more = ledger_customer_transactions(customer_id, created, tx_type, limit, offset)
         else:
-            customer_refunds = [r for r in filtered_refunds if r.get('charge') in [c['id'] for c in filtered_charges]]
-            return {
-                'charges': filtered_charges[:10],
-                'refunds': customer_refunds[:10]
-            }
+            transactions, has_more = query_customer_transactions(customer_id, created, tx_type, limit, offset)
+        result = {
+            'has_more': has_more,
+            'next_offset': offset + limit if has_more else None
+        }
+        if tx_type != 'refund':
+            result['charges'] = [t for t in transactions if t['object'] == 'charge']
+        if tx_type != 'charge':
+            result['refunds'] = [t for t in transactions if t['object'] == 'refund']
+        if tx_type is None:
+            result['transactions'] = transactions
+        return result
 
 @membership_ns.route('/refund-summary')
 class RefundSummary(Resource):
@@ -609,22 +641,17 @@ class RefundSummary(Resource):
         'end_date': {'description': 'End date (YYYY-MM-DD)', 'in': 'query', 'type': 'string'}
     })
     def get(self):
-        """Display refund summary and balance changes for a customer, filter by date"""
-        stripe.api_key = Config.STRIPE_SECRET_KEY
+        """Display refund summary and balance changes for a customer, filter by date (from the customer's charges or the ledger)"""
         customer_id = request.args.get('stripe_customer_id')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         if not customer_id:
             return {'message': 'stripe_customer_id required'}, 400
-        refunds = stripe.Refund.list(limit=100)
-        filtered_refunds = refunds['data']
-        if start_date:
-            start_ts = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
-            filtered_refunds = [r for r in filtered_refunds if r['created'] >= start_ts]
-        if end_date:
-            end_ts = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp())
-            filtered_refunds = [r for r in filtered_refunds if r['created'] <= end_ts]
-        customer_refunds = [r for r in filtered_refunds if r.get('charge') and stripe.Charge.retrieve(r['charge'])['customer'] == customer_id]
+        created = created_range(start_date, end_date)
+        if Config.LEDGER_READS_ENABLED:
+            customer_refunds = ledger_customer_refunds(customer_id, created)
+        else:
+            customer_refunds = list(iter_customer_refunds(customer_id, created))
         total_refunded = sum(r['amount'] for r in customer_refunds)
         return {
             'total_refunded': total_refunded / 100,
@@ -9,19 +9,16 @@ from flask import Blueprint, request, Response
 from app.config import Config
 from boto3.dynamodb.conditions import Attr
 from decimal import Decimal
-stripe.api_key = Config.STRIPE_SECRET_KEY
 from boto3.dynamodb.conditions import Key
 
 webhook_bp = Blueprint('stripe_webhook', __name__)
 
 
-# Use Users and Plans tables from Config
-users_table = Config.DYNAMODB_RESOURCE.Table('Users')
-plans_table = Config.DYNAMODB_RESOURCE.Table(os.environ.get('PLANS_TABLE', 'Plans'))
-
-
 # Import utility functions from stripe_utils
-from app.util.stripe_utils import send_sns_notification, extract_subscription_details, handle_checkout_session_completed, handle_customer_subscription_deleted, handle_customer_subscription_updated
+from app.util.stripe_utils import send_sns_notification
+from app.util.webhook_dispatch import dispatch_event_once
+from app.util.webhook_idempotency import is_done, PROCESSING
+from app.util.webhook_queue import enqueue_event
 
 
 @webhook_bp.route('/payment/webhook', methods=['POST'])
@@ -42,17 +39,19 @@ def stripe_webhook():
         return Response('Webhook signature verification failed', status=400)
 
     print(f"Received Stripe event: {event['type']}")
+    if is_done(event['id']):
+        return Response('Webhook already processed', status=200)
+    if Config.WEBHOOK_ASYNC_INGEST:
+        try:
+            enqueue_event(event, payload)
+            return Response('Webhook queued', status=200)
+        except Exception as e:
+            # Queue unavailable: fall back to handling the event inline
+            logging.error(f"Could not queue webhook event {event['id']}: {e}")
     try:
-        if event['type'] == 'checkout.session.completed':
-            handle_checkout_session_completed(event, users_table, plans_table)
-        elif event['type'] == 'customer.subscription.deleted':
-            handle_customer_subscription_deleted(event, users_table)
-        elif event['type'] == 'invoice.payment_failed':
-            # TODO: Implement logic for payment failure (e.g., notify user, update status)
-            logging.info(f"Handled invoice.payment_failed for event: {event}")
-        elif event['type'] == 'customer.subscription.updated':
-            handle_customer_subscription_updated(event, users_table, plans_table)
-        logging.info(f"Processed Stripe event: {event['type']} for user(s)")
+        if dispatch_event_once(event) == PROCESSING:
+            # Another delivery is still running; have Stripe retry in case it fails
+            return Response('Webhook event already in progress', status=409)
     except Exception as e:
         logging.error(f"Exception in webhook handler: {e}\n{traceback.format_exc()}")
         send_sns_notification(
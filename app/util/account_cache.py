@@ -0,0 +1,63 @@
+import threading
+import time
+from concurrent.futures import Future
+import stripe
+from app.config import Config
+
+
+class CoalescingTTLCache:
+    """
+    Short-TTL in-process cache with single-flight loading: when an entry is
+    missing or expired, the first caller fetches it and every concurrent
+    caller for the same key waits on that one fetch instead of issuing its own.
+    Failures are propagated to all waiters and are not cached.
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+
+    def get(self, key, loader):
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[1]
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            return future.result()
+        try:
+            value = loader()
+            self._entries[key] = (time.monotonic(), value)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+account_cache = CoalescingTTLCache(Config.ACCOUNT_CACHE_TTL_SECONDS)
+
+
+def get_balance():
+    """stripe.Balance.retrieve(), shared by all balance endpoints for a few seconds."""
+    return account_cache.get("balance", stripe.Balance.retrieve)
+
+
+def get_account():
+    """stripe.Account.retrieve(), shared for a few seconds."""
+    return account_cache.get("account", stripe.Account.retrieve)
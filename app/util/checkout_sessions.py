@@ -0,0 +1,66 @@
+import json
+import time
+import redis
+from app.config import Config
+
+# Sessions are not reused in their last minute, so the user never lands on an expired page
+EXPIRY_MARGIN_SECONDS = 60
+# Width of the window in which identical create requests share an idempotency key
+IDEMPOTENCY_WINDOW_SECONDS = 600
+
+
+def _key(user_id, price_id):
+    return f"checkout:open:{user_id}:{price_id}"
+
+
+def checkout_idempotency_key(user_id, price_id):
+    """Idempotency key for Session.create: retries and double clicks within the window get the same session."""
+    return f"checkout-{user_id}-{price_id}-{int(time.time() // IDEMPOTENCY_WINDOW_SECONDS)}"
+
+
+def get_open_session(user_id, price_id):
+    """Return the user's still-open checkout session for this price, if any."""
+    try:
+        raw = Config.REDIS_CLIENT.get(_key(user_id, price_id))
+    except redis.RedisError as e:
+        print(f"Open checkout session lookup failed: {e}")
+        return None
+    if not raw:
+        return None
+    session = json.loads(raw)
+    if session.get("expires_at", 0) - time.time() <= EXPIRY_MARGIN_SECONDS:
+        return None
+    return session
+
+
+def remember_session(user_id, price_id, session, stripe_customer_id):
+    """Record an open checkout session until just before its expires_at."""
+    expires_at = session.get("expires_at") or 0
+    ttl = int(expires_at - time.time() - EXPIRY_MARGIN_SECONDS)
+    if ttl <= 0:
+        return
+    value = json.dumps({
+        "sessionId": session["id"],
+        "url": session["url"],
+        "stripeCustomerId": stripe_customer_id,
+        "expires_at": expires_at,
+    })
+    try:
+        Config.REDIS_CLIENT.set(_key(user_id, price_id), value, ex=ttl)
+    except redis.RedisError as e:
+        print(f"Recording open checkout session failed: {e}")
+
+
+def forget_session(user_id, price_id):
+    if not (user_id and price_id):
+        return
+    try:
+        Config.REDIS_CLIENT.delete(_key(user_id, price_id))
+    except redis.RedisError as e:
+        print(f"Forgetting open checkout session failed: {e}")
+
+
+def handle_checkout_session_closed(event):
+    """checkout.session.completed / checkout.session.expired: the session can no longer be reused."""
+    metadata = event['data']['object'].get('metadata') or {}
+    forget_session(metadata.get('userId'), metadata.get('planId'))
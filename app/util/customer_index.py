@@ -0,0 +1,45 @@
+import redis
+from app.config import Config
+from app.util.users_repository import users_repository
+
+# userId -> Stripe customer id index. The Users table is the source of truth
+# (stripeCustomerId on the item); Redis keeps the link one key read away.
+# Webhooks resolve customers to users through the stripeCustomerId GSI, since
+# they need every linked user and their identity attributes, not just an id.
+USER_KEY = "customer_index:user:{}"
+
+
+def _cache_link(user_id, stripe_customer_id):
+    try:
+        Config.REDIS_CLIENT.set(USER_KEY.format(user_id), stripe_customer_id, ex=Config.CUSTOMER_INDEX_CACHE_TTL_SECONDS)
+    except redis.RedisError as e:
+        print(f"Error caching customer link {user_id} -> {stripe_customer_id}: {e}")
+
+
+def _cached(key):
+    try:
+        return Config.REDIS_CLIENT.get(key)
+    except redis.RedisError as e:
+        print(f"Customer index cache read failed: {e}")
+        return None
+
+
+def link_customer(user_id, stripe_customer_id, email=None):
+    """Record that user_id owns stripe_customer_id, in the Users table and the cache."""
+    users_repository.set_stripe_customer_id(user_id, stripe_customer_id, email)
+    _cache_link(user_id, stripe_customer_id)
+
+
+def get_customer_id(user_id):
+    """Stripe customer id for a user, or None."""
+    if not user_id:
+        return None
+    stripe_customer_id = _cached(USER_KEY.format(user_id))
+    if stripe_customer_id:
+        return stripe_customer_id
+    user_item = users_repository.get_by_user_id(user_id, ["userId", "stripeCustomerId"])
+    stripe_customer_id = user_item.get("stripeCustomerId") if user_item else None
+    if stripe_customer_id:
+        _cache_link(user_id, stripe_customer_id)
+    return stripe_customer_id
+
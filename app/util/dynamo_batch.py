@@ -0,0 +1,46 @@
+import time
+from app.config import Config
+from app.util.dynamo_scan import build_projection
+
+# DynamoDB rejects BatchGetItem requests with more than 100 keys
+BATCH_GET_MAX_KEYS = 100
+
+
+def batch_get_items(table, key_name, key_values, projection=None, max_retries=5, dynamodb_resource=None):
+    """
+    Fetch items by primary key with chunked BatchGetItem calls.
+
+    Key values are deduplicated (falsy values are skipped) and requested in
+    chunks of 100. UnprocessedKeys are retried with exponential backoff; if
+    keys are still unprocessed after `max_retries` an exception is raised
+    rather than silently returning a partial result.
+
+    Returns a dict of key value -> item. Keys with no item are absent.
+    """
+    resource = dynamodb_resource or Config.DYNAMODB_RESOURCE
+    unique_values = list(dict.fromkeys(value for value in key_values if value))
+    base_request = {}
+    if projection:
+        # The key attribute is needed to map results back to the requested ids
+        attributes = list(dict.fromkeys([key_name] + list(projection)))
+        projection_expr, names = build_projection(attributes)
+        base_request["ProjectionExpression"] = projection_expr
+        base_request["ExpressionAttributeNames"] = names
+
+    items = {}
+    for start in range(0, len(unique_values), BATCH_GET_MAX_KEYS):
+        chunk = unique_values[start:start + BATCH_GET_MAX_KEYS]
+        request_items = {table.name: dict(base_request, Keys=[{key_name: value} for value in chunk])}
+        attempt = 0
+        while request_items:
+            response = resource.batch_get_item(RequestItems=request_items)
+            for item in response.get("Responses", {}).get(table.name, []):
+                items[item[key_name]] = item
+            request_items = response.get("UnprocessedKeys") or {}
+            if request_items:
+                attempt += 1
+                if attempt > max_retries:
+                    pending = len(request_items[table.name]["Keys"])
+                    raise Exception(f"BatchGetItem on {table.name} left {pending} keys unprocessed after {max_retries} retries")
+                time.sleep(min(0.05 * (2 ** attempt), 2))
+    return items
@@ -0,0 +1,105 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Sentinel a segment worker puts on the queue once it has read its last page
+_SEGMENT_DONE = object()
+
+
+def build_projection(attributes):
+    """
+    Build ProjectionExpression/ExpressionAttributeNames for a list of attribute
+    names. Every name goes through a placeholder so reserved words such as
+    `name` or `groups` are safe to project.
+    """
+    names = {f"#p{i}": attribute for i, attribute in enumerate(attributes)}
+    return ", ".join(names), names
+
+
+def _scan_kwargs(projection, filter_expression, page_size, segment, total_segments):
+    kwargs = {}
+    if projection:
+        projection_expr, names = build_projection(projection)
+        kwargs["ProjectionExpression"] = projection_expr
+        kwargs["ExpressionAttributeNames"] = names
+    if filter_expression is not None:
+        kwargs["FilterExpression"] = filter_expression
+    if page_size:
+        kwargs["Limit"] = page_size
+    if total_segments > 1:
+        kwargs["Segment"] = segment
+        kwargs["TotalSegments"] = total_segments
+    return kwargs
+
+
+def _scan_pages(table, scan_kwargs, stop_event=None):
+    while True:
+        response = table.scan(**scan_kwargs)
+        yield response.get("Items", [])
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key or (stop_event is not None and stop_event.is_set()):
+            return
+        scan_kwargs["ExclusiveStartKey"] = last_key
+
+
+def scan_all(table, projection=None, filter_expression=None, segments=1, page_size=None, max_buffered_pages=None):
+    """
+    Stream every item of a DynamoDB table, following LastEvaluatedKey until the
+    table is exhausted.
+
+    With segments > 1 the table is split with Segment/TotalSegments and each
+    segment is read on its own thread. Pages are handed back through a bounded
+    queue, so memory stays at roughly `max_buffered_pages` pages no matter how
+    large the table is. Item order is not defined when segments > 1.
+
+    `projection` is an optional list of attribute names to read and
+    `filter_expression` an optional boto3 condition (e.g. Attr("active").eq(True)).
+    Closing the generator early stops the segment workers after their current page.
+    """
+    if segments <= 1:
+        scan_kwargs = _scan_kwargs(projection, filter_expression, page_size, 0, 1)
+        for items in _scan_pages(table, scan_kwargs):
+            yield from items
+        return
+
+    pages = queue.Queue(maxsize=max_buffered_pages or segments * 2)
+    stop_event = threading.Event()
+
+    def put(value):
+        # Re-check the stop flag while blocked so a closed generator never strands a worker
+        while not stop_event.is_set():
+            try:
+                pages.put(value, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def scan_segment(segment):
+        try:
+            scan_kwargs = _scan_kwargs(projection, filter_expression, page_size, segment, segments)
+            for items in _scan_pages(table, scan_kwargs, stop_event):
+                if stop_event.is_set():
+                    return
+                if items:
+                    put(items)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SEGMENT_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=segments, thread_name_prefix=f"scan-{table.name}")
+    try:
+        for segment in range(segments):
+            executor.submit(scan_segment, segment)
+        remaining = segments
+        while remaining:
+            page = pages.get()
+            if page is _SEGMENT_DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False)
@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from app.config import Config
+
+# One bounded pool per process shared by every fan-out. Calls submitted to it
+# must not fan out again themselves, or a saturated pool could deadlock.
+_executor = ThreadPoolExecutor(max_workers=Config.FANOUT_MAX_WORKERS, thread_name_prefix="fanout")
+
+
+class FanOutTimeout(Exception):
+    pass
+
+
+def fan_out(calls, timeout=None, return_exceptions=False):
+    """
+    Run independent blocking calls (e.g. Stripe requests) concurrently.
+
+    `calls` maps a name to a zero-argument callable. Returns a dict of name ->
+    result once every call has finished, so latency is that of the slowest
+    call rather than the sum. Each call must finish within `timeout` seconds
+    (default Config.FANOUT_TIMEOUT_SECONDS) of the fan-out starting, otherwise
+    FanOutTimeout is raised for it.
+
+    By default the first failure (in `calls` order) is re-raised and calls that
+    have not started yet are cancelled. With return_exceptions=True, failures
+    are returned in place of results instead.
+    """
+    timeout = Config.FANOUT_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    futures = {name: _executor.submit(fn) for name, fn in calls.items()}
+    results = {}
+    try:
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                error = FanOutTimeout(f"{name} did not finish within {timeout}s")
+                if not return_exceptions:
+                    raise error
+                results[name] = error
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[name] = e
+    except Exception:
+        for future in futures.values():
+            future.cancel()
+        raise
+    return results
@@ -0,0 +1,234 @@
+import heapq
+import itertools
+import json
+import time
+import stripe
+from sqlalchemy import and_, or_
+from app.models.user import db
+from app.util import stripe_memo
+from app.models.ledger import LedgerCharge, LedgerRefund, LedgerPayout, LedgerInvoice
+
+
+def _plain(obj):
+    # StripeObject -> plain JSON-compatible dict for the JSON column
+    return json.loads(json.dumps(obj, default=str))
+
+
+def _is_stale(row, synced_at):
+    return row is not None and row.synced_at > synced_at
+
+
+LEDGER_MODELS = (LedgerCharge, LedgerRefund, LedgerPayout, LedgerInvoice)
+
+
+def ensure_ledger_tables():
+    """Create any missing ledger table (needs an app context). Other tables are left alone."""
+    db.metadata.create_all(bind=db.engine, tables=[model.__table__ for model in LEDGER_MODELS])
+
+
+# -------------------------
+# Sync (webhooks and backfill)
+# -------------------------
+def upsert_charge(charge, synced_at=None):
+    synced_at = synced_at or int(time.time())
+    if _is_stale(db.session.get(LedgerCharge, charge['id']), synced_at):
+        return
+    db.session.merge(LedgerCharge(
+        id=charge['id'],
+        customer_id=charge.get('customer'),
+        amount=charge['amount'],
+        amount_refunded=charge.get('amount_refunded') or 0,
+        currency=charge['currency'],
+        status=charge.get('status'),
+        paid=charge.get('paid'),
+        refunded=charge.get('refunded'),
+        invoice_id=charge.get('invoice'),
+        created=charge['created'],
+        synced_at=synced_at,
+        raw=_plain(charge),
+    ))
+
+
+def _refund_customer_id(refund):
+    charge = refund.get('charge')
+    if isinstance(charge, dict):
+        return charge.get('customer')
+    if not charge:
+        return None
+    # Charges are normally already in the ledger; fetch and store the rare missing one
+    row = db.session.get(LedgerCharge, charge)
+    if row is None:
+        charge_obj = stripe.Charge.retrieve(charge)
+        upsert_charge(charge_obj)
+        return charge_obj.get('customer')
+    return row.customer_id
+
+
+def upsert_refund(refund, synced_at=None):
+    synced_at = synced_at or int(time.time())
+    if _is_stale(db.session.get(LedgerRefund, refund['id']), synced_at):
+        return
+    customer_id = _refund_customer_id(refund)
+    raw = _plain(refund)
+    if isinstance(raw.get('charge'), dict):
+        raw['charge'] = raw['charge'].get('id')
+    db.session.merge(LedgerRefund(
+        id=refund['id'],
+        charge_id=raw.get('charge'),
+        customer_id=customer_id,
+        amount=refund['amount'],
+        currency=refund['currency'],
+        status=refund.get('status'),
+        reason=refund.get('reason'),
+        created=refund['created'],
+        synced_at=synced_at,
+        raw=raw,
+    ))
+
+
+def upsert_payout(payout, synced_at=None):
+    synced_at = synced_at or int(time.time())
+    if _is_stale(db.session.get(LedgerPayout, payout['id']), synced_at):
+        return
+    db.session.merge(LedgerPayout(
+        id=payout['id'],
+        amount=payout['amount'],
+        currency=payout['currency'],
+        status=payout.get('status'),
+        arrival_date=payout.get('arrival_date'),
+        created=payout['created'],
+        synced_at=synced_at,
+        raw=_plain(payout),
+    ))
+
+
+def upsert_invoice(invoice, synced_at=None):
+    synced_at = synced_at or int(time.time())
+    if _is_stale(db.session.get(LedgerInvoice, invoice['id']), synced_at):
+        return
+    raw = _plain(invoice)
+    db.session.merge(LedgerInvoice(
+        id=invoice['id'],
+        customer_id=invoice.get('customer'),
+        subscription_id=invoice.get('subscription'),
+        number=invoice.get('number'),
+        status=invoice.get('status'),
+        amount_due=invoice.get('amount_due'),
+        amount_paid=invoice.get('amount_paid'),
+        currency=invoice.get('currency'),
+        hosted_invoice_url=invoice.get('hosted_invoice_url'),
+        invoice_pdf=invoice.get('invoice_pdf'),
+        created=invoice['created'],
+        synced_at=synced_at,
+        raw=raw,
+    ))
+
+
+def delete_invoice(invoice_id):
+    row = db.session.get(LedgerInvoice, invoice_id)
+    if row is not None:
+        db.session.delete(row)
+
+
+def handle_ledger_event(event):
+    """Apply charge.*, charge.refund.*, refund.*, payout.* and invoice.* webhook events to the ledger."""
+    obj = event['data']['object']
+    kind = obj.get('object')
+    synced_at = event.get('created')
+    if kind == 'charge':
+        upsert_charge(obj, synced_at)
+        if event['type'] == 'charge.refunded':
+            # Recent API versions no longer embed refunds in the charge
+            for refund in stripe.Refund.list(charge=obj['id'], limit=100).auto_paging_iter():
+                upsert_refund(refund, synced_at)
+    elif kind == 'refund':
+        upsert_refund(obj, synced_at)
+    elif kind == 'payout':
+        upsert_payout(obj, synced_at)
+    elif kind == 'invoice':
+        if event['type'] == 'invoice.deleted':
+            # Only drafts can be deleted; they never reach customers
+            delete_invoice(obj['id'])
+        else:
+            upsert_invoice(obj, synced_at)
+    else:
+        return
+    db.session.commit()
+    print(f"Ledger updated from {event['type']} for {obj['id']}")
+
+
+# -------------------------
+# Queries (reporting endpoints)
+# -------------------------
+def get_invoice(invoice_id):
+    """
+    Mirrored invoice as a Stripe-shaped dict. An invoice the mirror has not
+    seen yet (its invoice.* event can arrive after the event that references
+    it), or has only seen as a draft without a PDF, is fetched from Stripe
+    and stored.
+    """
+    row = db.session.get(LedgerInvoice, invoice_id)
+    if row is not None and row.status != 'draft' and row.invoice_pdf:
+        return row.raw
+    invoice = stripe_memo.retrieve(stripe.Invoice, invoice_id)
+    upsert_invoice(invoice)
+    db.session.commit()
+    return _plain(invoice)
+
+
+def _newest_first(query, model):
+    return query.order_by(model.created.desc(), model.id.desc())
+
+
+def _filter_created(query, model, created):
+    if created and 'gte' in created:
+        query = query.filter(model.created >= created['gte'])
+    if created and 'lte' in created:
+        query = query.filter(model.created <= created['lte'])
+    return query
+
+
+class InvalidCursor(ValueError):
+    """A starting_after id that is not in the ledger (e.g. a cursor issued while reading from Stripe)."""
+
+
+def ledger_list_page(model, key, limit, starting_after=None, created=None, **filters):
+    """
+    One newest-first page from a ledger table, in the same shape as
+    stripe_pagination.list_page (keyset pagination on created, id).
+    """
+    query = _filter_created(model.query.filter_by(**filters), model, created)
+    if starting_after:
+        cursor = db.session.get(model, starting_after)
+        if cursor is None:
+            # Ignoring it would serve the first page again and loop a paging client
+            raise InvalidCursor(f"starting_after {starting_after} is not a known {model.__tablename__} id")
+        query = query.filter(or_(
+            model.created < cursor.created,
+            and_(model.created == cursor.created, model.id < cursor.id),
+        ))
+    rows = _newest_first(query, model).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        key: [row.raw for row in rows],
+        'has_more': has_more,
+        'next_starting_after': rows[-1].id if has_more and rows else None,
+    }
+
+
+def ledger_customer_refunds(customer_id, created=None):
+    query = _filter_created(LedgerRefund.query.filter_by(customer_id=customer_id), LedgerRefund, created)
+    return [row.raw for row in _newest_first(query, LedgerRefund).all()]
+
+
+def ledger_customer_transactions(customer_id, created=None, tx_type=None, limit=10, offset=0):
+    """Same contract as transaction_query.query_customer_transactions, served from SQL."""
+    streams = []
+    for model, kind in ((LedgerCharge, 'charge'), (LedgerRefund, 'refund')):
+        if tx_type in (None, kind):
+            query = _filter_created(model.query.filter_by(customer_id=customer_id), model, created)
+            streams.append(row.raw for row in _newest_first(query, model).limit(offset + limit + 1))
+    merged = heapq.merge(*streams, key=lambda obj: obj['created'], reverse=True)
+    window = list(itertools.islice(merged, offset, offset + limit + 1))
+    return window[:limit], len(window) > limit
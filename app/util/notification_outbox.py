@@ -0,0 +1,150 @@
+import json
+import logging
+import time
+import uuid
+import redis
+from app.config import Config
+from app.util.process_threads import start_once_per_process
+
+# Outbox for SNS notifications and SES emails. Request and webhook code only
+# appends a message to a Redis list; a background sender thread (one per
+# process, started by create_app or on first use) drains it, publishing SNS
+# messages with publish_batch (up to 10 per call, per topic) and sending SES
+# emails through one shared client. Failed messages are retried with exponential backoff
+# from a sorted set scored by their next attempt time; each message carries a
+# unique id so identical notifications stay separate members. Messages that
+# still fail after MAX_ATTEMPTS are moved to a dead-letter list. A sender that
+# dies in the middle of a batch loses at most that batch.
+OUTBOX_KEY = "notifications:outbox"
+RETRY_KEY = "notifications:outbox:retry"
+DEAD_LETTER_KEY = "notifications:outbox:dead"
+BATCH_SIZE = 50
+SNS_BATCH_LIMIT = 10
+MAX_ATTEMPTS = 6
+DEPTH_LOG_INTERVAL_SECONDS = 60
+
+def _deliver_sns(messages):
+    """Publish SNS messages in batches per topic. Returns the messages that failed."""
+    failed = []
+    by_topic = {}
+    for message in messages:
+        by_topic.setdefault(message["topic_arn"], []).append(message)
+    for topic_arn, topic_messages in by_topic.items():
+        for start in range(0, len(topic_messages), SNS_BATCH_LIMIT):
+            chunk = topic_messages[start:start + SNS_BATCH_LIMIT]
+            entries = [
+                {"Id": str(i), "Subject": m["subject"][:100], "Message": m["message"]}
+                for i, m in enumerate(chunk)
+            ]
+            try:
+                response = Config.SNS_CLIENT.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=entries)
+            except Exception as e:
+                logging.error(f"SNS publish_batch to {topic_arn} failed: {e}")
+                failed.extend(chunk)
+                continue
+            for failure in response.get("Failed", []):
+                logging.error(f"SNS message rejected by {topic_arn}: {failure.get('Code')} {failure.get('Message')}")
+                failed.append(chunk[int(failure["Id"])])
+    return failed
+
+
+def _deliver_ses(message):
+    try:
+        Config.SES_CLIENT.send_templated_email(
+            Source=message["source"],
+            Destination={"ToAddresses": [message["to"]]},
+            Template=message["template"],
+            TemplateData=message["template_data"],
+        )
+        logging.info(f"Email {message['template']} sent to {message['to']}")
+        return True
+    except Exception as e:
+        logging.error(f"Error sending email {message['template']} to {message['to']}: {e}")
+        return False
+
+
+def _deliver(messages):
+    """Send a batch of outbox messages. Returns the messages that failed."""
+    failed = _deliver_sns([m for m in messages if m["kind"] == "sns"])
+    failed.extend(m for m in messages if m["kind"] == "ses" and not _deliver_ses(m))
+    return failed
+
+
+def _schedule_retries(failed):
+    retries = {}
+    dead = []
+    for message in failed:
+        message["attempts"] = message.get("attempts", 0) + 1
+        if message["attempts"] >= MAX_ATTEMPTS:
+            logging.error(f"Moving {message['kind']} notification {message.get('id')} to {DEAD_LETTER_KEY} after {message['attempts']} attempts")
+            dead.append(json.dumps(message))
+            continue
+        retries[json.dumps(message)] = time.time() + 2 ** message["attempts"]
+    with Config.REDIS_CLIENT.pipeline() as pipe:
+        if retries:
+            pipe.zadd(RETRY_KEY, retries)
+        if dead:
+            pipe.rpush(DEAD_LETTER_KEY, *dead)
+        pipe.execute()
+
+
+def _requeue_due_retries():
+    due = Config.REDIS_CLIENT.zrangebyscore(RETRY_KEY, 0, time.time(), start=0, num=BATCH_SIZE)
+    if not due:
+        return
+    with Config.REDIS_CLIENT.pipeline() as pipe:
+        pipe.zrem(RETRY_KEY, *due)
+        pipe.rpush(OUTBOX_KEY, *due)
+        pipe.execute()
+
+
+def outbox_depth():
+    """Messages waiting to be sent, including ones waiting for a retry."""
+    with Config.REDIS_CLIENT.pipeline() as pipe:
+        pipe.llen(OUTBOX_KEY)
+        pipe.zcard(RETRY_KEY)
+        queued, retrying = pipe.execute()
+    return queued + retrying
+
+
+def _send_loop():
+    last_depth_log = 0
+    while True:
+        try:
+            _requeue_due_retries()
+            first = Config.REDIS_CLIENT.blpop(OUTBOX_KEY, timeout=1)
+            if first:
+                rest = Config.REDIS_CLIENT.lpop(OUTBOX_KEY, BATCH_SIZE - 1) or []
+                messages = [json.loads(raw) for raw in [first[1], *rest]]
+                _schedule_retries(_deliver(messages))
+            if time.monotonic() - last_depth_log >= DEPTH_LOG_INTERVAL_SECONDS:
+                last_depth_log = time.monotonic()
+                logging.info(f"Notification outbox depth: {outbox_depth()}")
+        except Exception as e:
+            logging.error(f"Notification outbox sender error: {e}")
+            time.sleep(1)
+
+
+def ensure_sender():
+    start_once_per_process("notification-outbox", _send_loop)
+
+
+def _enqueue(message):
+    message["id"] = uuid.uuid4().hex
+    message["attempts"] = 0
+    try:
+        Config.REDIS_CLIENT.rpush(OUTBOX_KEY, json.dumps(message))
+    except redis.RedisError as e:
+        # No outbox: send inline rather than lose the notification
+        logging.warning(f"Notification outbox unavailable, sending inline: {e}")
+        _deliver([message])
+        return
+    ensure_sender()
+
+
+def enqueue_sns(topic_arn, subject, message):
+    _enqueue({"kind": "sns", "topic_arn": topic_arn, "subject": subject, "message": message})
+
+
+def enqueue_templated_email(source, to_email, template, template_data):
+    _enqueue({"kind": "ses", "source": source, "to": to_email, "template": template, "template_data": json.dumps(template_data)})
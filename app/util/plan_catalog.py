@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+from decimal import Decimal
+import redis
+from app.config import Config
+from app.util.dynamo_scan import scan_all
+from app.util.process_threads import start_once_per_process
+
+CATALOG_SNAPSHOT_KEY = "catalog:snapshot"
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_CHANNEL = "catalog:invalidate"
+
+
+def _encode_decimal(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class PlanCatalog:
+    """
+    Catalog of the Plans table shared by every worker.
+
+    Each process keeps a local index of plans by lowercase planId and by
+    stripePriceId. A cold process first reads the JSON
+    snapshot stored in Redis and only scans DynamoDB when no snapshot exists,
+    publishing what it read for the other workers. Admin writes call
+    publish_change(), which bumps the catalog version, drops the snapshot and
+    notifies every worker over pub/sub so their local copies are discarded.
+    The TTL remains as a safety net for missed notifications.
+    """
+
+    def __init__(self, plans_table, redis_client, ttl_seconds):
+        self.plans_table = plans_table
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._by_plan_id = {}
+        self._by_price_id = {}
+        self._loaded_at = None
+        self._generation = 0
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def _read_snapshot(self):
+        try:
+            raw = self.redis.get(CATALOG_SNAPSHOT_KEY)
+        except redis.RedisError as e:
+            print(f"Catalog snapshot read failed: {e}")
+            return None
+        if not raw:
+            return None
+        return json.loads(raw, parse_float=Decimal, parse_int=Decimal)
+
+    def _write_snapshot(self, version, snapshot):
+        payload = json.dumps(snapshot, default=_encode_decimal)
+        try:
+            with self.redis.pipeline() as pipe:
+                # Only publish the snapshot if no admin write happened while we were scanning
+                pipe.watch(CATALOG_VERSION_KEY)
+                if int(pipe.get(CATALOG_VERSION_KEY) or 0) != version:
+                    return
+                pipe.multi()
+                pipe.set(CATALOG_SNAPSHOT_KEY, payload, ex=self.ttl_seconds)
+                pipe.execute()
+        except redis.WatchError:
+            pass
+        except redis.RedisError as e:
+            print(f"Catalog snapshot write failed: {e}")
+
+    def _current_version(self):
+        try:
+            return int(self.redis.get(CATALOG_VERSION_KEY) or 0)
+        except redis.RedisError as e:
+            print(f"Catalog version read failed: {e}")
+            return None
+
+    def _load(self):
+        generation = self._generation
+        snapshot = self._read_snapshot()
+        if snapshot is None:
+            version = self._current_version()
+            snapshot = {
+                "version": version,
+                "plans": list(scan_all(self.plans_table)),
+            }
+            if version is not None:
+                self._write_snapshot(version, snapshot)
+        by_plan_id = {}
+        by_price_id = {}
+        for item in snapshot["plans"]:
+            if item.get("planId"):
+                by_plan_id[item["planId"].lower()] = item
+            if item.get("stripePriceId"):
+                by_price_id[item["stripePriceId"]] = item
+        self._by_plan_id = by_plan_id
+        self._by_price_id = by_price_id
+        # An invalidation that arrived mid-load means what we read may already be stale
+        self._loaded_at = time.monotonic() if generation == self._generation else None
+        print(f"Plan catalog loaded {len(by_plan_id)} plans (version {snapshot.get('version')})")
+
+    def _ensure_listener(self):
+        start_once_per_process("catalog-invalidation", self._listen)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CATALOG_CHANNEL)
+                # Anything published while we were not subscribed is lost, so start clean
+                self.invalidate()
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        print(f"Catalog invalidated by publish (version {message.get('data')})")
+                        self.invalidate()
+            except Exception as e:
+                print(f"Catalog invalidation listener error: {e}")
+                time.sleep(5)
+
+    def _ensure_loaded(self):
+        self._ensure_listener()
+        if self._is_fresh():
+            return
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if not self._is_fresh():
+                self._load()
+
+    def find_by_plan_id(self, plan_id):
+        if not plan_id:
+            return None
+        self._ensure_loaded()
+        return self._by_plan_id.get(plan_id.lower())
+
+    def find_by_price_id(self, price_id):
+        if not price_id:
+            return None
+        self._ensure_loaded()
+        return self._by_price_id.get(price_id)
+
+    def invalidate(self):
+        """Drop this process's copy; the next lookup reloads it."""
+        self._generation += 1
+        self._loaded_at = None
+
+    def publish_change(self):
+        """Invalidate the catalog in every worker after a Plans write."""
+        self.invalidate()
+        try:
+            with self.redis.pipeline() as pipe:
+                pipe.incr(CATALOG_VERSION_KEY)
+                pipe.delete(CATALOG_SNAPSHOT_KEY)
+                version, _ = pipe.execute()
+            self.redis.publish(CATALOG_CHANNEL, version)
+        except redis.RedisError as e:
+            print(f"Catalog invalidation publish failed: {e}")
+
+
+plan_catalog = PlanCatalog(Config.PLANS_TABLE, Config.REDIS_CLIENT, Config.PLAN_CATALOG_TTL_SECONDS)
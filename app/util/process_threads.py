@@ -0,0 +1,18 @@
+import os
+import threading
+
+# Threads do not survive a gunicorn fork, so each background thread is started
+# once per worker process: a name is remembered with the pid that started it.
+_started = {}
+_lock = threading.Lock()
+
+
+def start_once_per_process(name, target):
+    """Start a daemon thread running target unless this process already did."""
+    if _started.get(name) == os.getpid():
+        return
+    with _lock:
+        if _started.get(name) == os.getpid():
+            return
+        _started[name] = os.getpid()
+        threading.Thread(target=target, name=name, daemon=True).start()
@@ -0,0 +1,149 @@
+import json
+import time
+import redis
+import stripe
+from app.config import Config
+from app.util.stripe_pagination import list_page
+
+# Objects are cached per id; list pages are cached under a generation number
+# that is bumped on every catalog change, which invalidates all of them at once.
+# Each cached object carries the time its copy was current (event `created`,
+# or when a fetch or modify was made) and is only replaced by a newer copy, so
+# a late webhook or a slow read-through cannot overwrite fresher data.
+CATALOG_RESOURCES = {
+    'product': stripe.Product,
+    'price': stripe.Price,
+}
+GENERATION_KEY = "stripe:catalog:generation"
+
+
+# Hash fields: v = version (unix time), obj = JSON object ("" once deleted)
+_SET_IF_NEWER_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'v')
+if current and tonumber(current) > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'v', ARGV[1], 'obj', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+_set_if_newer = Config.REDIS_CLIENT.register_script(_SET_IF_NEWER_SCRIPT)
+
+
+def _object_key(kind, object_id):
+    return f"stripe:catalog:{kind}:{object_id}"
+
+
+def _list_key(kind, generation, limit, starting_after):
+    return f"stripe:{kind}:list:{generation}:{limit}:{starting_after or ''}"
+
+
+def _cache_get(key):
+    try:
+        raw = Config.REDIS_CLIENT.get(key)
+    except redis.RedisError as e:
+        print(f"Stripe catalog cache read failed for {key}: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+
+def _cache_set(key, value):
+    try:
+        Config.REDIS_CLIENT.set(key, json.dumps(value, default=str), ex=Config.STRIPE_CATALOG_CACHE_TTL_SECONDS)
+    except redis.RedisError as e:
+        print(f"Stripe catalog cache write failed for {key}: {e}")
+
+
+def _object_get(key):
+    try:
+        raw = Config.REDIS_CLIENT.hget(key, 'obj')
+    except redis.RedisError as e:
+        print(f"Stripe catalog cache read failed for {key}: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+
+def _object_set(key, obj, version):
+    """Store obj unless the cache already holds a newer copy. obj=None records a deletion."""
+    value = json.dumps(obj, default=str) if obj is not None else ""
+    try:
+        _set_if_newer(keys=[key], args=[version, value, Config.STRIPE_CATALOG_CACHE_TTL_SECONDS])
+    except redis.RedisError as e:
+        print(f"Stripe catalog cache write failed for {key}: {e}")
+
+
+def _generation():
+    try:
+        return int(Config.REDIS_CLIENT.get(GENERATION_KEY) or 0)
+    except redis.RedisError as e:
+        print(f"Stripe catalog generation read failed: {e}")
+        return None
+
+
+def _bump_generation():
+    try:
+        Config.REDIS_CLIENT.incr(GENERATION_KEY)
+    except redis.RedisError as e:
+        print(f"Stripe catalog generation bump failed: {e}")
+
+
+def get_catalog_object(kind, object_id):
+    """Read-through fetch of a Stripe Product or Price by id."""
+    key = _object_key(kind, object_id)
+    cached = _object_get(key)
+    if cached is not None:
+        return cached
+    # Stamped with the time the fetch started: a copy stored by a modify or
+    # webhook while the retrieve was in flight is newer and wins
+    fetched_at = time.time()
+    obj = CATALOG_RESOURCES[kind].retrieve(object_id)
+    _object_set(key, obj, fetched_at)
+    return obj
+
+
+def list_catalog_page(kind, limit, starting_after=None):
+    """
+    Read-through fetch of one page of Product.list / Price.list, in the same
+    shape as stripe_pagination.list_page.
+    """
+    generation = _generation()
+    key = _list_key(kind, generation, limit, starting_after) if generation is not None else None
+    if key:
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+    page = list_page(CATALOG_RESOURCES[kind].list, f"{kind}s", limit=limit, starting_after=starting_after)
+    if key:
+        _cache_set(key, page)
+    return page
+
+
+def cache_catalog_object(obj, version=None):
+    """
+    Store a fresh Product/Price (e.g. the result of a modify call) and
+    invalidate cached lists. `version` defaults to now.
+    """
+    kind = obj.get('object')
+    if kind not in CATALOG_RESOURCES:
+        return
+    _object_set(_object_key(kind, obj['id']), obj, version if version is not None else time.time())
+    _bump_generation()
+
+
+def evict_catalog_object(kind, object_id, version=None):
+    """Record a deletion, so older copies arriving later are not cached again."""
+    _object_set(_object_key(kind, object_id), None, version if version is not None else time.time())
+    _bump_generation()
+
+
+def handle_catalog_event(event):
+    """Apply product.* / price.* webhook events to the cache."""
+    obj = event['data']['object']
+    kind = obj.get('object')
+    if kind not in CATALOG_RESOURCES:
+        return
+    if event['type'].endswith('.deleted'):
+        evict_catalog_object(kind, obj['id'], event['created'])
+    else:
+        cache_catalog_object(obj, event['created'])
+    print(f"Stripe catalog cache updated from {event['type']} for {obj['id']}")
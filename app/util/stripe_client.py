@@ -0,0 +1,47 @@
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+from app.config import Config
+
+try:
+    from stripe import RequestsClient
+except ImportError:  # stripe < 8
+    from stripe.http_client import RequestsClient
+
+_configured = False
+
+
+def build_http_client():
+    """
+    Stripe HTTP client backed by one shared keep-alive connection pool, so
+    request threads reuse TLS connections instead of opening their own.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=Config.STRIPE_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=Config.STRIPE_HTTP_POOL_MAXSIZE,
+        pool_block=False,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsClient(
+        session=session,
+        timeout=(Config.STRIPE_CONNECT_TIMEOUT, Config.STRIPE_READ_TIMEOUT),
+    )
+
+
+def configure_stripe():
+    """
+    Configure the stripe module once per process: API key, pooled HTTP client
+    with explicit connect/read timeouts, and network retries. Stripe retries
+    with idempotency keys, so retried POSTs are safe.
+    """
+    global _configured
+    if _configured:
+        return
+    stripe.api_key = Config.STRIPE_SECRET_KEY
+    stripe.max_network_retries = Config.STRIPE_MAX_NETWORK_RETRIES
+    if Config.STRIPE_API_BASE:
+        stripe.api_base = Config.STRIPE_API_BASE
+    stripe.default_http_client = build_http_client()
+    _configured = True
@@ -0,0 +1,63 @@
+import contextlib
+import contextvars
+
+# Per-event / per-request memo of Stripe retrieves. Inside a memo_scope(),
+# retrieve() fetches each Stripe object at most once; objects that arrive
+# expanded inside another one (e.g. a subscription's default_payment_method)
+# are remembered too, so asking for them later costs no call. Outside a
+# scope retrieve() is a plain passthrough. Scopes are per context, so
+# concurrent requests and worker threads never share objects.
+_memo = contextvars.ContextVar("stripe_memo", default=None)
+
+
+@contextlib.contextmanager
+def memo_scope():
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+def open_scope():
+    """Start a scope without a with-block (e.g. in a before_request hook); pass the token to close_scope()."""
+    return _memo.set({})
+
+
+def close_scope(token):
+    try:
+        _memo.reset(token)
+    except ValueError:
+        # Token from another context (e.g. teardown on a different thread)
+        _memo.set(None)
+
+
+def _remember(memo, obj, expanded):
+    if not isinstance(obj, dict) or not obj.get('id') or not obj.get('object'):
+        return
+    key = (obj['object'], obj['id'])
+    cached = memo.get(key)
+    if cached is None or expanded >= cached[1]:
+        memo[key] = (obj, expanded)
+    # Register expanded children under their own type and id
+    for value in obj.values():
+        if isinstance(value, dict) and value.get('id') and value.get('object'):
+            _remember(memo, value, frozenset())
+
+
+def retrieve(resource, object_id, expand=None):
+    """
+    resource.retrieve(object_id, expand=expand), memoized in the current scope.
+    A cached copy is reused when it was fetched with at least the requested expansions.
+    """
+    expanded = frozenset(expand or ())
+    memo = _memo.get()
+    if memo is None:
+        return resource.retrieve(object_id, expand=list(expanded)) if expanded else resource.retrieve(object_id)
+    key = (resource.OBJECT_NAME, object_id)
+    cached = memo.get(key)
+    if cached is not None and expanded <= cached[1]:
+        return cached[0]
+    obj = resource.retrieve(object_id, expand=list(expanded)) if expanded else resource.retrieve(object_id)
+    _remember(memo, obj, expanded)
+    return obj
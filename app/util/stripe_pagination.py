@@ -0,0 +1,81 @@
+import json
+from flask import Response, request
+
+# Stripe caps list page size at 100
+MAX_PAGE_LIMIT = 100
+# Objects per NDJSON chunk written to the client while streaming
+STREAM_CHUNK_SIZE = 50
+
+PAGINATION_DOC_PARAMS = {
+    'limit': {'description': 'Page size (1-100, default 100)', 'in': 'query', 'type': 'integer'},
+    'starting_after': {'description': 'Cursor: id of the last object of the previous page', 'in': 'query', 'type': 'string'},
+    'stream': {'description': 'If true, stream every page as NDJSON instead of returning one page', 'in': 'query', 'type': 'boolean'},
+}
+
+
+def pagination_args():
+    """Read limit/starting_after/stream from the query string."""
+    try:
+        limit = int(request.args.get('limit', MAX_PAGE_LIMIT))
+    except ValueError:
+        limit = MAX_PAGE_LIMIT
+    return {
+        'limit': max(1, min(limit, MAX_PAGE_LIMIT)),
+        'starting_after': request.args.get('starting_after') or None,
+        'stream': request.args.get('stream', '').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def list_page(list_fn, key, limit=MAX_PAGE_LIMIT, starting_after=None, **params):
+    """
+    Fetch one page of a Stripe list call and return it under `key` together
+    with the cursor for the next page.
+    """
+    if starting_after:
+        params['starting_after'] = starting_after
+    page = list_fn(limit=limit, **params)
+    data = page['data']
+    has_more = page.get('has_more', False)
+    return {
+        key: data,
+        'has_more': has_more,
+        'next_starting_after': data[-1]['id'] if has_more and data else None,
+    }
+
+
+def iter_all(list_fn, starting_after=None, **params):
+    """Lazily walk every page of a Stripe list call, one object at a time."""
+    if starting_after:
+        params['starting_after'] = starting_after
+    return list_fn(limit=MAX_PAGE_LIMIT, **params).auto_paging_iter()
+
+
+def stream_ndjson(items, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream an iterable of Stripe objects (e.g. from iter_all) as
+    newline-delimited JSON. Pages are fetched only as the client consumes the
+    response, and output is flushed every `chunk_size` objects, so the worker
+    never holds more than a page in memory.
+    """
+    def generate():
+        buffer = []
+        for item in items:
+            buffer.append(json.dumps(item, default=str))
+            if len(buffer) >= chunk_size:
+                yield "\n".join(buffer) + "\n"
+                buffer = []
+        if buffer:
+            yield "\n".join(buffer) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+def paginated_list(list_fn, key, **params):
+    """
+    Serve a Stripe list endpoint from the current request's pagination args:
+    NDJSON stream when ?stream=true, otherwise a single cursor page.
+    """
+    args = pagination_args()
+    if args['stream']:
+        return stream_ndjson(iter_all(list_fn, starting_after=args['starting_after'], **params))
+    return list_page(list_fn, key, limit=args['limit'], starting_after=args['starting_after'], **params)
@@ -5,17 +5,21 @@ import os
 import stripe
 from app.config import Config
 import boto3
-import json
 import logging
 from app.util.plan_groups import SUBSCRIPTION_GROUPS, UNSUBSCRIBED_GROUP
-from boto3.dynamodb.conditions import Attr
 from app.config import Config
+from app.util.plan_catalog import plan_catalog
+from app.util.ledger import get_invoice
+from app.util.customer_index import link_customer
+from app.util import stripe_memo
+from app.util.notification_outbox import enqueue_sns, enqueue_templated_email
+from app.util.users_repository import UsersRepository, normalize_email, USER_IDENTITY_ATTRIBUTES
 # Utility: Calculate next renewal date from Stripe subscription id
 def get_next_renewal_date(stripe_subscription_id):
     if not stripe_subscription_id:
         return ''
     try:
-        sub_obj = stripe.Subscription.retrieve(stripe_subscription_id)
+        sub_obj = stripe_memo.retrieve(stripe.Subscription, stripe_subscription_id)
         period_end = sub_obj.get('current_period_end')
         if period_end:
             import datetime
@@ -33,16 +37,14 @@ def get_invoice_link(invoice_id):
     if not invoice_id:
         return None
     try:
-        invoice_obj = stripe.Invoice.retrieve(invoice_id)
+        invoice_obj = get_invoice(invoice_id)
         return invoice_obj.get('invoice_pdf')
     except Exception as e:
         print(f"Error retrieving invoice PDF: {e}")
         return None
 
-# Utility: Send SES templated email
+# Utility: Queue the SES templated confirmation email (sent by the notification outbox)
 def send_subscription_confirmation_email(to_email, user_name, plan_name, amount, currency, next_renewal, dashboard_link, invoice_link):
-    import boto3
-    ses_client = boto3.client('ses')
     template_data = {
         "userName": user_name,
         "planName": plan_name,
@@ -52,33 +54,23 @@ def send_subscription_confirmation_email(to_email, user_name, plan_name, amount,
         "dashboardLink": dashboard_link,
         "invoiceLink": invoice_link
     }
-    try:
-        ses_client.send_templated_email(
-            Source="no-reply@greeksinsight.com",
-            Destination={"ToAddresses": [to_email]},
-            Template="subscription_confirmation",
-            TemplateData=json.dumps(template_data)
-        )
-        print(f"Subscription confirmation email sent to {to_email}")
-    except Exception as e:
-        print(f"Error sending subscription confirmation email: {e}")
-# Utility: Get invoice PDF link from Stripe
+    enqueue_templated_email(
+        source="no-reply@greeksinsight.com",
+        to_email=to_email,
+        template="subscription_confirmation",
+        template_data=template_data
+    )
+    print(f"Subscription confirmation email queued for {to_email}")
+# Utility: Get invoice PDF link from the invoice mirror
 def get_invoice_pdf_link(invoice_id):
     if not invoice_id:
         return None
     try:
-        invoice_obj = stripe.Invoice.retrieve(invoice_id)
+        invoice_obj = get_invoice(invoice_id)
         return invoice_obj.get('invoice_pdf')
     except Exception as e:
         print(f"Error retrieving invoice PDF: {e}")
         return None
-# Utility: Find user by email (case-insensitive)
-def find_user_by_email_case_insensitive(email):
-    user_resp = Config.USERS_TABLE.scan()
-    for item in user_resp.get("Items", []):
-        if item.get("email", "").lower() == email.lower():
-            return item
-    return None
 # Utility: Convert unix epoch time to ISO 8601 timestamp string
 def epoch_to_timestamp(epoch):
     if not epoch:
@@ -90,13 +82,9 @@ def epoch_to_timestamp(epoch):
         print(f"Error converting epoch to timestamp: {e}")
         return None
 
-# Utility: Find plan by id (case-insensitive)
+# Utility: Find plan by id (case-insensitive) from the in-process plan catalog
 def find_plan_by_id_case_insensitive(plan_id):
-    scan_resp = Config.PLANS_TABLE.scan()
-    for item in scan_resp.get("Items", []):
-        if item.get("planId", "").lower() == plan_id.lower():
-            return item
-    return None
+    return plan_catalog.find_by_plan_id(plan_id)
 
 # Utility: Ensure Stripe customer exists for user
 def ensure_stripe_customer(user_item, email, user_id):
@@ -106,15 +94,13 @@ def ensure_stripe_customer(user_item, email, user_id):
         try:
             customer = stripe.Customer.create(
                 email=email,
-                metadata={"user_id": user_id}
+                metadata={"user_id": user_id},
+                # Concurrent or retried checkouts for a new user must not create two customers
+                idempotency_key=f"customer-create-{user_id}"
             )
             stripe_customer_id = customer["id"]
             if user_item:
-                Config.USERS_TABLE.update_item(
-                    Key={"userId": user_item["userId"]},
-                    UpdateExpression="SET stripeCustomerId=:cid",
-                    ExpressionAttributeValues={":cid": stripe_customer_id}
-                )
+                link_customer(user_item["userId"], stripe_customer_id, email)
         except Exception as e:
             raise Exception(f"Failed to create Stripe customer: {str(e)}")
     return stripe_customer_id
@@ -137,24 +123,13 @@ def build_checkout_session_params(stripe_customer_id, price_id, user_id, allowed
         "customer_update":{"shipping": "auto"}
     }
 
-# Utility: Get Stripe customer id by email
-def get_stripe_customer_id_by_email(users_table, email):
-    from boto3.dynamodb.conditions import Attr
-    response = users_table.scan(
-        FilterExpression=Attr("email").eq(email)
-    )
-    items = response.get("Items", [])
-    if not items:
-        return None
-    return items[0].get("stripeCustomerId")
-
-# Utility: Send failure SNS notification
+# Utility: Queue failure SNS notification
 def send_failure_sns(subject, message):
-    Config.SNS_CLIENT.publish(TopicArn=Config.FAILURE_TOPIC_ARN, Subject=subject, Message=message)
+    enqueue_sns(Config.FAILURE_TOPIC_ARN, subject, message)
 
-# General SNS notification for Stripe events
+# General SNS notification for Stripe events (queued, published in batches)
 def send_sns_notification(subject, message):
-    Config.SNS_CLIENT.publish(TopicArn=Config.CHECKOUT_STARTED_SNS, Subject=subject, Message=message)
+    enqueue_sns(Config.CHECKOUT_STARTED_SNS, subject, message)
 
 # Extract product_id, price_id, and payment_id from a Stripe subscription object
 def extract_subscription_details(subscription):
@@ -176,6 +151,7 @@ def handle_checkout_session_completed(event, users_table, plans_table):
     stripe_subscription_id = session.get('subscription')
     customer_email = session.get('customer_details').get('email') if session.get('customer_details') else None
     invoice = session.get('invoice')
+    # Served from the invoice mirror; the confirmation email reuses the same link
     invoice_pdf = get_invoice_pdf_link(invoice)
     amount_total = session.get('amount_total')
     if amount_total is not None:
@@ -191,39 +167,37 @@ def handle_checkout_session_completed(event, users_table, plans_table):
     plan_name = "unsubscribed"
     if stripe_subscription_id:
         try:
-            subscription_obj = stripe.Subscription.retrieve(stripe_subscription_id)
+            # One call for the subscription and its payment method; the renewal
+            # date for the confirmation email reuses the same object
+            subscription_obj = stripe_memo.retrieve(stripe.Subscription, stripe_subscription_id, expand=['default_payment_method'])
             productId, priceId, default_payment_method = extract_subscription_details(subscription_obj)
+            if isinstance(default_payment_method, dict):
+                default_payment_method = default_payment_method.get('id')
             # Fetch payment method details if available
             if default_payment_method:
                 try:
-                    payment_method_details = stripe.PaymentMethod.retrieve(default_payment_method)
+                    payment_method_details = stripe_memo.retrieve(stripe.PaymentMethod, default_payment_method)
                 except Exception as e:
                     print(f"Error retrieving payment method details: {e}")
-            # Fetch plan_name from Plans table using priceId
+            # Fetch plan_name from the plan catalog using priceId
             if priceId:
-                plan_resp = plans_table.scan()
-                for item in plan_resp.get("Items", []):
-                    if item.get("stripePriceId", "") == priceId:
-                        plan_id = item.get("planId")
-                        plan_name = item.get("planGroup", "unsubscribed")
-                        break
+                plan_item = plan_catalog.find_by_price_id(priceId)
+                if plan_item:
+                    plan_id = plan_item.get("planId")
+                    plan_name = plan_item.get("planGroup", "unsubscribed")
                 if not plan_name:
                     plan_name = "unsubscribed"
         except Exception as e:
             print(f"Error retrieving subscription details: {e}")
     # Try to fetch by case-insensitive email, fallback to stripeCustomerId if not found
+    users = UsersRepository(users_table)
     items = []
     if customer_email:
-        scan_resp = users_table.scan()
-        for item in scan_resp.get("Items", []):
-            if item.get("email", "").lower() == customer_email.lower():
-                items = [item]
-                break
+        user_item = users.get_by_email(customer_email, USER_IDENTITY_ATTRIBUTES)
+        if user_item:
+            items = [user_item]
     if not items and stripe_customer_id:
-        response = users_table.scan(
-            FilterExpression=Attr("stripeCustomerId").eq(stripe_customer_id)
-        )
-        items = response.get("Items", [])
+        items = users.list_by_stripe_customer_id(stripe_customer_id, USER_IDENTITY_ATTRIBUTES)
     if items:
         user_item = items[0]
         user_id = user_item["userId"]  # assumes userId is the partition key
@@ -245,25 +219,31 @@ def handle_checkout_session_completed(event, users_table, plans_table):
                 }
             except Exception as e:
                 print(f"Error extracting payment method summary: {e}")
+        update_expr = "SET stripeSubscriptionId = :s, subscriptionStatus = :st, invoice = :i, invoicePdf = :ipdf, amountTotal = :a, currency = :c, paymentStatus = :p, productId = :prod, priceId = :price, paymentId = :pay, paymentMethodSummary = :pms, planOpted = :plan, planId = :plan_id, groups = :grps"
+        expr_values = {
+            ":s": stripe_subscription_id,
+            ":st": subscription_status,
+            ":i": invoice,
+            ":ipdf": invoice_pdf,
+            ":a": amount_total,
+            ":c": currency,
+            ":p": payment_status,
+            ":prod": productId,
+            ":price": priceId,
+            ":pay": default_payment_method,
+            ":pms": payment_method_summary,
+            ":plan": plan_name,
+            ":plan_id": plan_id,
+            ":grps": [plan_name]
+        }
+        email_lower = normalize_email(user_item.get("email") or customer_email)
+        if email_lower:
+            update_expr += ", emailLower = :el"
+            expr_values[":el"] = email_lower
         users_table.update_item(
             Key={"userId": user_id},
-            UpdateExpression="SET stripeSubscriptionId = :s, subscriptionStatus = :st, invoice = :i, invoicePdf = :ipdf, amountTotal = :a, currency = :c, paymentStatus = :p, productId = :prod, priceId = :price, paymentId = :pay, paymentMethodSummary = :pms, planOpted = :plan, planId = :plan_id, groups = :grps",
-            ExpressionAttributeValues={
-                ":s": stripe_subscription_id,
-                ":st": subscription_status,
-                ":i": invoice,
-                ":ipdf": invoice_pdf,
-                ":a": amount_total,
-                ":c": currency,
-                ":p": payment_status,
-                ":prod": productId,
-                ":price": priceId,
-                ":pay": default_payment_method,
-                ":pms": payment_method_summary,
-                ":plan": plan_name,
-                ":plan_id": plan_id,
-                ":grps": [plan_name]
-            },
+            UpdateExpression=update_expr,
+            ExpressionAttributeValues=expr_values,
         )
         print(f"Updated subscription for userId={user_id} with invoice, amount, currency, payment status, subscription id, planOpted={plan_name}, and invoicePdf={invoice_pdf}.")
         # Update Cognito groups
@@ -280,16 +260,15 @@ def handle_checkout_session_completed(event, users_table, plans_table):
         )
         # Send SES subscription confirmation email
         try:
-            next_renewal = get_next_renewal_date(stripe_subscription_id)
             send_subscription_confirmation_email(
                 to_email=customer_email,
                 user_name=user_item.get('userName') or user_item.get('username') or customer_email,
                 plan_name=plan_name,
                 amount=amount_total,
                 currency=currency,
-                next_renewal=next_renewal,
+                next_renewal=get_next_renewal_date(stripe_subscription_id),
                 dashboard_link=get_dashboard_link(user_id),
-                invoice_link=get_invoice_link(invoice)
+                invoice_link=invoice_pdf
             )
         except Exception as e:
             print(f"Error in SES email logic: {e}")
@@ -302,10 +281,8 @@ def handle_customer_subscription_deleted(event, users_table):
     cancelAt = epoch_to_timestamp(subscription.get('cancel_at'))
     canceledAt = epoch_to_timestamp(subscription.get('canceled_at'))
     
-    response = users_table.scan(
-        FilterExpression=Attr("stripeCustomerId").eq(stripe_customer_id)
-    )
-    for item in response.get('Items', []):
+    user_items = UsersRepository(users_table).list_by_stripe_customer_id(stripe_customer_id, USER_IDENTITY_ATTRIBUTES)
+    for item in user_items:
         # Only set unsubscribed if not (active and cancel_at_period_end==True)
         if not (subscription_status == 'active' and cancelAtPeriodEnd):
             users_table.update_item(
@@ -332,7 +309,7 @@ def handle_customer_subscription_deleted(event, users_table):
                 print(f"Error updating Cognito groups on subscription deleted: {e}")
     send_sns_notification(
         subject="⚠️ Stripe Subscription Deleted",
-        message=f"customer.subscription.deleted for customerId={stripe_customer_id}, userIds={[item['userId'] for item in response.get('Items', [])]}"
+        message=f"customer.subscription.deleted for customerId={stripe_customer_id}, userIds={[item['userId'] for item in user_items]}"
     )
 
 
@@ -342,7 +319,6 @@ def handle_customer_subscription_updated(event, users_table, plans_table):
     Handles the Stripe event 'customer.subscription.updated'.
     Updates user's plan, subscription status, and Cognito group in users_table.
     """
-    from boto3.dynamodb.conditions import Attr
     subscription = event['data']['object']
     stripe_customer_id = subscription.get('customer')
     subscription_status = subscription.get('status')
@@ -351,10 +327,7 @@ def handle_customer_subscription_updated(event, users_table, plans_table):
     cancelAt = epoch_to_timestamp(subscription.get('cancel_at'))
     endedAt = epoch_to_timestamp(subscription.get('ended_at'))
     
-    response = users_table.scan(
-        FilterExpression=Attr("stripeCustomerId").eq(stripe_customer_id)
-    )
-    for item in response.get('Items', []):
+    for item in UsersRepository(users_table).list_by_stripe_customer_id(stripe_customer_id, USER_IDENTITY_ATTRIBUTES):
         user_id = item['userId']
         update_expr = "SET subscriptionStatus=:st, planOpted=:plan, cancelAtPeriodEnd=:cape, endedAt=:ea, cancelAt=:cat, canceledAt=:cdat"
         expr_attr_vals = {
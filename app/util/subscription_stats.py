@@ -0,0 +1,167 @@
+import threading
+import time
+import redis
+import stripe
+from app.config import Config
+
+# Redis layout:
+#   COUNTS_KEY      hash status -> number of subscriptions in that status
+#   SUBSCRIPTIONS_KEY hash subscription id -> "<status>|<event created>"
+# Canceled subscriptions are kept in SUBSCRIPTIONS_KEY as tombstones (so a late
+# customer.subscription.updated cannot resurrect them) but are not counted,
+# matching Subscription.list(), which leaves canceled subscriptions out.
+# Reconcile prunes tombstones older than MEMBERSHIP_STATS_TOMBSTONE_SECONDS.
+COUNTS_KEY = "membership:stats:status_counts"
+SUBSCRIPTIONS_KEY = "membership:stats:subscriptions"
+RECONCILED_AT_KEY = "membership:stats:reconciled_at"
+RECONCILE_LOCK_KEY = "membership:stats:reconcile_lock"
+# Transitions sent per pipeline round trip while merging a reconcile walk
+RECONCILE_PIPELINE_SIZE = 500
+UNCOUNTED_STATUS = "canceled"
+
+# Applies one status transition atomically; events older than the last one
+# applied to the same subscription are ignored.
+_TRANSITION_SCRIPT = """
+local current = redis.call('HGET', KEYS[2], ARGV[1])
+local old_status = nil
+local old_created = -1
+if current then
+    local sep = string.find(current, '|', 1, true)
+    old_status = string.sub(current, 1, sep - 1)
+    old_created = tonumber(string.sub(current, sep + 1))
+end
+if tonumber(ARGV[3]) < old_created then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2] .. '|' .. ARGV[3])
+if old_status == ARGV[2] then
+    return 0
+end
+if old_status and old_status ~= ARGV[4] then
+    redis.call('HINCRBY', KEYS[1], old_status, -1)
+end
+if ARGV[2] ~= ARGV[4] then
+    redis.call('HINCRBY', KEYS[1], ARGV[2], 1)
+end
+return 1
+"""
+_transition = Config.REDIS_CLIENT.register_script(_TRANSITION_SCRIPT)
+
+# Deletes a subscription entry only if no event changed it since it was read
+_PRUNE_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+_prune = Config.REDIS_CLIENT.register_script(_PRUNE_SCRIPT)
+
+
+def record_subscription_event(event):
+    """Apply a customer.subscription.* webhook event to the status counters."""
+    subscription = event['data']['object']
+    status = subscription.get('status')
+    if not status:
+        return
+    try:
+        _transition(
+            keys=[COUNTS_KEY, SUBSCRIPTIONS_KEY],
+            args=[subscription['id'], status, event.get('created', int(time.time())), UNCOUNTED_STATUS],
+        )
+    except redis.RedisError as e:
+        # The periodic reconcile repairs anything missed here
+        print(f"Error recording subscription status for {subscription['id']}: {e}")
+
+
+def get_status_counts():
+    """Current counters, or None if they have never been reconciled or Redis is unavailable."""
+    try:
+        if not Config.REDIS_CLIENT.exists(RECONCILED_AT_KEY):
+            return None
+        counts = Config.REDIS_CLIENT.hgetall(COUNTS_KEY)
+    except redis.RedisError as e:
+        print(f"Error reading subscription status counts: {e}")
+        return None
+    return {status: int(count) for status, count in counts.items() if int(count) > 0}
+
+
+def _merge_walk(statuses, started):
+    """
+    Apply the walked statuses through the same transition script as the
+    webhooks, stamped with the walk's start time: anything a webhook applied
+    with a newer `created` while the walk ran is kept. Subscriptions the walk
+    did not see (Subscription.list leaves canceled ones out) become canceled,
+    and tombstones older than the retention are pruned.
+    """
+    transitions = list(statuses.items())
+    prunes = []
+    prune_before = started - Config.MEMBERSHIP_STATS_TOMBSTONE_SECONDS
+    for sub_id, value in Config.REDIS_CLIENT.hscan_iter(SUBSCRIPTIONS_KEY):
+        if sub_id in statuses:
+            continue
+        status, created = value.split('|', 1)
+        if status != UNCOUNTED_STATUS:
+            transitions.append((sub_id, UNCOUNTED_STATUS))
+        elif int(created) < prune_before:
+            # Existing tombstones keep their own `created` so they can age out
+            prunes.append((sub_id, value))
+    for start in range(0, len(transitions), RECONCILE_PIPELINE_SIZE):
+        with Config.REDIS_CLIENT.pipeline(transaction=False) as pipe:
+            for sub_id, status in transitions[start:start + RECONCILE_PIPELINE_SIZE]:
+                _transition(keys=[COUNTS_KEY, SUBSCRIPTIONS_KEY], args=[sub_id, status, started, UNCOUNTED_STATUS], client=pipe)
+            pipe.execute()
+    for start in range(0, len(prunes), RECONCILE_PIPELINE_SIZE):
+        with Config.REDIS_CLIENT.pipeline(transaction=False) as pipe:
+            for sub_id, value in prunes[start:start + RECONCILE_PIPELINE_SIZE]:
+                _prune(keys=[SUBSCRIPTIONS_KEY], args=[sub_id, value], client=pipe)
+            pipe.execute()
+    Config.REDIS_CLIENT.set(RECONCILED_AT_KEY, started)
+
+
+def reconcile_status_counts():
+    """
+    Walk every subscription in Stripe and merge the result into the counters.
+    This is the slow path: it is linear in the number of subscriptions. If
+    Redis is unavailable the walked counts are still returned.
+    """
+    status_counts = {}
+    statuses = {}
+    started = int(time.time())
+    for sub in stripe.Subscription.list(limit=100).auto_paging_iter():
+        status = sub['status']
+        status_counts[status] = status_counts.get(status, 0) + 1
+        statuses[sub['id']] = status
+    try:
+        _merge_walk(statuses, started)
+    except redis.RedisError as e:
+        print(f"Error merging subscription status counts: {e}")
+        return status_counts
+    print(f"Reconciled subscription status counts: {status_counts}")
+    return get_status_counts() or status_counts
+
+
+def _reconcile_in_background():
+    try:
+        reconcile_status_counts()
+    except Exception as e:
+        print(f"Error reconciling subscription status counts: {e}")
+    finally:
+        try:
+            Config.REDIS_CLIENT.delete(RECONCILE_LOCK_KEY)
+        except redis.RedisError as e:
+            print(f"Error releasing subscription stats reconcile lock: {e}")
+
+
+def schedule_reconcile_if_stale():
+    """Start a background reconcile when the last one is older than the configured interval."""
+    try:
+        reconciled_at = int(Config.REDIS_CLIENT.get(RECONCILED_AT_KEY) or 0)
+        if time.time() - reconciled_at < Config.MEMBERSHIP_STATS_RECONCILE_SECONDS:
+            return
+        # Only one worker across the fleet runs the walk
+        if not Config.REDIS_CLIENT.set(RECONCILE_LOCK_KEY, 1, nx=True, ex=3600):
+            return
+    except redis.RedisError as e:
+        print(f"Error checking subscription stats reconcile: {e}")
+        return
+    threading.Thread(target=_reconcile_in_background, name="membership-stats-reconcile", daemon=True).start()
@@ -0,0 +1,109 @@
+from datetime import datetime
+import heapq
+import itertools
+import stripe
+
+
+def created_range(start_date=None, end_date=None):
+    """
+    Build Stripe's `created` range filter from YYYY-MM-DD dates, or None when
+    neither bound is given. Bounds are inclusive, as the endpoints always had them.
+    """
+    created = {}
+    if start_date:
+        created['gte'] = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
+    if end_date:
+        created['lte'] = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp())
+    return created or None
+
+
+def _in_range(obj, created):
+    if created and 'gte' in created and obj['created'] < created['gte']:
+        return False
+    if created and 'lte' in created and obj['created'] > created['lte']:
+        return False
+    return True
+
+
+def _charge_refunds(charge):
+    refunds = charge.get('refunds')
+    if not isinstance(refunds, dict):
+        return []
+    if refunds.get('has_more'):
+        # The expanded list holds the first page only; rare for a single charge
+        return list(stripe.Refund.list(charge=charge['id'], limit=100).auto_paging_iter())
+    return refunds.get('data', [])
+
+
+def _iter_customer_charges_with_refunds(customer_id, created=None):
+    """
+    Yield (charge, refunds) for the customer's charges, newest first, with
+    the charge's refunds in the `created` range. A refund is never older than
+    its charge, so only the upper bound can be pushed down to the charge
+    list; every older charge has to be read, since any of them may have been
+    refunded inside the range.
+    """
+    params = {'customer': customer_id, 'limit': 100, 'expand': ['data.refunds']}
+    if created and 'lte' in created:
+        params['created'] = {'lte': created['lte']}
+    for charge in stripe.Charge.list(**params).auto_paging_iter():
+        refunds = _charge_refunds(charge) if charge.get('amount_refunded') else []
+        yield charge, [refund for refund in refunds if _in_range(refund, created)]
+
+
+def iter_customer_refunds(customer_id, created=None):
+    """
+    Yield the customer's refunds in the `created` range, newest first.
+
+    Refunds are read from the customer's own charges (refunds expanded), so
+    the cost is one Stripe call per 100 of the customer's charges, however
+    many refunds the rest of the account has. Refunds of different charges
+    interleave in time, so the whole walk is done and sorted before the
+    first refund is yielded.
+    """
+    refunds = [
+        refund
+        for _, charge_refunds in _iter_customer_charges_with_refunds(customer_id, created)
+        for refund in charge_refunds
+    ]
+    refunds.sort(key=lambda refund: refund['created'], reverse=True)
+    return iter(refunds)
+
+
+def iter_customer_charges(customer_id, created=None):
+    """Yield the customer's charges in the `created` range, newest first."""
+    params = {'customer': customer_id, 'limit': 100}
+    if created:
+        params['created'] = created
+    return stripe.Charge.list(**params).auto_paging_iter()
+
+
+def _iter_customer_transactions(customer_id, created=None, include_charges=True):
+    for charge, refunds in _iter_customer_charges_with_refunds(customer_id, created):
+        if include_charges and _in_range(charge, created):
+            yield charge
+        yield from refunds
+
+
+def query_customer_transactions(customer_id, created=None, tx_type=None, limit=10, offset=0):
+    """
+    Window over a customer's charges and/or refunds, newest first.
+
+    Charges alone are read lazily with the date range pushed down, so only as
+    many pages are fetched as the window needs. Refunds come from the
+    customer's own charges (see iter_customer_refunds), never from the
+    account-wide refund list; a refund of an old charge may be the newest
+    item, so a window with refunds walks every charge up to the upper bound.
+    That walk is done once, yielding the charges as well, and only the
+    window's worth of items is kept in a heap.
+
+    Returns (items, has_more), where each item is a Stripe charge or refund
+    (its `object` field says which).
+    """
+    # Read one extra item to know whether another window exists
+    if tx_type == 'charge':
+        window = list(itertools.islice(iter_customer_charges(customer_id, created), offset, offset + limit + 1))
+    else:
+        items = _iter_customer_transactions(customer_id, created, include_charges=tx_type is None)
+        window = heapq.nlargest(offset + limit + 1, items, key=lambda obj: obj['created'])[offset:]
+    return window[:limit], len(window) > limit
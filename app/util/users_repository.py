@@ -0,0 +1,111 @@
+from typing import Dict, List, Optional, Sequence
+from boto3.dynamodb.conditions import Key
+from app.config import Config
+from app.util.dynamo_scan import build_projection
+
+# Named projections for the callers that read Users items.
+# Keeping them here avoids pulling paymentMethodSummary, invoice links and
+# subscription metadata on paths that only need a handful of attributes.
+USER_IDENTITY_ATTRIBUTES = ["userId", "email", "userName", "username"]
+USER_DETAILS_ATTRIBUTES = ["name", "email", "planOpted", "cancelAt"]
+USER_CHECKOUT_ATTRIBUTES = ["userId", "email", "paymentStatus", "subscriptionStatus", "stripeCustomerId"]
+USER_SUBSCRIPTION_ATTRIBUTES = ["userId", "stripeSubscriptionId"]
+USER_CUSTOMER_ATTRIBUTES = ["userId", "stripeCustomerId", "emailLower"]
+USER_GROUPS_ATTRIBUTES = ["userId", "groups"]
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Value stored in the emailLower attribute and used as the email GSI key."""
+    if not email:
+        return None
+    return email.strip().lower()
+
+
+def _projection_kwargs(attributes: Optional[Sequence[str]]) -> Dict:
+    if not attributes:
+        return {}
+    projection_expr, names = build_projection(attributes)
+    return {"ProjectionExpression": projection_expr, "ExpressionAttributeNames": names}
+
+
+class UsersRepository:
+    """
+    Lookups and small writes against the DynamoDB Users table.
+
+    Every read takes an optional `attributes` projection; pass one of the
+    *_ATTRIBUTES lists above (or your own) so only the needed attributes are
+    read. Omitting it returns the full item.
+    """
+
+    def __init__(self, table, email_index: str = Config.USERS_EMAIL_INDEX, customer_index: str = Config.USERS_CUSTOMER_INDEX):
+        self.table = table
+        self.email_index = email_index
+        self.customer_index = customer_index
+
+    def get_by_user_id(self, user_id: str, attributes: Optional[Sequence[str]] = None) -> Optional[Dict]:
+        if not user_id:
+            return None
+        response = self.table.get_item(Key={"userId": user_id}, **_projection_kwargs(attributes))
+        return response.get("Item")
+
+    def get_by_email(self, email: str, attributes: Optional[Sequence[str]] = None) -> Optional[Dict]:
+        """Case-insensitive lookup through the emailLower GSI."""
+        email_lower = normalize_email(email)
+        if not email_lower:
+            return None
+        response = self.table.query(
+            IndexName=self.email_index,
+            KeyConditionExpression=Key("emailLower").eq(email_lower),
+            Limit=1,
+            **_projection_kwargs(attributes)
+        )
+        items = response.get("Items", [])
+        return items[0] if items else None
+
+    def list_by_stripe_customer_id(self, stripe_customer_id: str, attributes: Optional[Sequence[str]] = None) -> List[Dict]:
+        """All users linked to a Stripe customer, through the stripeCustomerId GSI."""
+        if not stripe_customer_id:
+            return []
+        query_kwargs = {
+            "IndexName": self.customer_index,
+            "KeyConditionExpression": Key("stripeCustomerId").eq(stripe_customer_id),
+            **_projection_kwargs(attributes),
+        }
+        items = []
+        while True:
+            response = self.table.query(**query_kwargs)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def get_stripe_customer_id_by_email(self, email: str) -> Optional[str]:
+        user_item = self.get_by_email(email, ["stripeCustomerId"])
+        return user_item.get("stripeCustomerId") if user_item else None
+
+    def set_stripe_customer_id(self, user_id: str, stripe_customer_id: str, email: Optional[str] = None) -> None:
+        """Store the Stripe customer id, keeping emailLower in sync when the email is known."""
+        update_expr = "SET stripeCustomerId=:cid"
+        expr_values = {":cid": stripe_customer_id}
+        email_lower = normalize_email(email)
+        if email_lower:
+            update_expr += ", emailLower=:el"
+            expr_values[":el"] = email_lower
+        self.table.update_item(
+            Key={"userId": user_id},
+            UpdateExpression=update_expr,
+            ExpressionAttributeValues=expr_values
+        )
+
+    def set_email_lower(self, user_id: str, email: str) -> None:
+        email_lower = normalize_email(email)
+        if not email_lower:
+            return
+        self.table.update_item(
+            Key={"userId": user_id},
+            UpdateExpression="SET emailLower=:el",
+            ExpressionAttributeValues={":el": email_lower}
+        )
+
+
+users_repository = UsersRepository(Config.USERS_TABLE)
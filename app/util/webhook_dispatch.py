@@ -0,0 +1,64 @@
+import os
+import logging
+from app.config import Config
+from app.util.stripe_utils import handle_checkout_session_completed, handle_customer_subscription_deleted, handle_customer_subscription_updated
+from app.util.stripe_catalog_cache import handle_catalog_event
+from app.util.subscription_stats import record_subscription_event
+from app.util.ledger import handle_ledger_event
+from app.util.checkout_sessions import handle_checkout_session_closed
+from app.util.webhook_idempotency import claim_event, mark_done, release_event
+from app.util import stripe_memo
+
+# Use Users and Plans tables from Config
+users_table = Config.DYNAMODB_RESOURCE.Table('Users')
+plans_table = Config.DYNAMODB_RESOURCE.Table(os.environ.get('PLANS_TABLE', 'Plans'))
+
+
+def dispatch_event(event):
+    """
+    Run the handlers for one verified Stripe event. Shared by the inline
+    webhook route and webhook_worker.py; exceptions propagate to the caller.
+    Stripe retrieves made by the handlers are memoized for the event.
+    """
+    with stripe_memo.memo_scope():
+        _dispatch(event)
+
+
+def _dispatch(event):
+    if event['type'].startswith('customer.subscription.'):
+        record_subscription_event(event)
+    if event['type'] in ('checkout.session.completed', 'checkout.session.expired'):
+        handle_checkout_session_closed(event)
+    if event['type'] == 'checkout.session.completed':
+        handle_checkout_session_completed(event, users_table, plans_table)
+    elif event['type'] == 'customer.subscription.deleted':
+        handle_customer_subscription_deleted(event, users_table)
+    elif event['type'] == 'invoice.payment_failed':
+        # TODO: Implement logic for payment failure (e.g., notify user, update status)
+        logging.info(f"Handled invoice.payment_failed for event: {event}")
+    elif event['type'] == 'customer.subscription.updated':
+        handle_customer_subscription_updated(event, users_table, plans_table)
+    elif event['type'].startswith(('product.', 'price.')):
+        handle_catalog_event(event)
+    if event['type'].startswith(('charge.', 'refund.', 'payout.', 'invoice.')):
+        handle_ledger_event(event)
+    logging.info(f"Processed Stripe event: {event['type']} for user(s)")
+
+
+def dispatch_event_once(event):
+    """
+    dispatch_event() unless the event id was already handled or is being
+    handled right now. Returns None when the handlers ran, otherwise the
+    idempotency state ("done" or "processing") that skipped them.
+    """
+    state = claim_event(event['id'])
+    if state is not None:
+        print(f"Skipping duplicate Stripe event {event['id']} ({event['type']}): {state}")
+        return state
+    try:
+        dispatch_event(event)
+    except Exception:
+        release_event(event['id'])
+        raise
+    mark_done(event['id'])
+    return None
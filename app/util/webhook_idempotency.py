@@ -0,0 +1,50 @@
+import redis
+from app.config import Config
+
+# Idempotency ledger for Stripe webhook events, keyed by event id:
+#   "processing" while a handler runs (expires so a crashed handler is retried)
+#   "done"       once the handlers succeeded (kept for Stripe's retry window)
+# A failed handler deletes its claim so the next delivery runs again.
+PROCESSING = "processing"
+DONE = "done"
+
+
+def _key(event_id):
+    return f"stripe:webhook:event:{event_id}"
+
+
+def claim_event(event_id):
+    """
+    Claim an event for handling. Returns None when the caller should handle
+    it, otherwise the state ("processing" or "done") that makes it a duplicate.
+    """
+    try:
+        if Config.REDIS_CLIENT.set(_key(event_id), PROCESSING, nx=True, ex=Config.WEBHOOK_PROCESSING_TTL_SECONDS):
+            return None
+        return Config.REDIS_CLIENT.get(_key(event_id)) or PROCESSING
+    except redis.RedisError as e:
+        # Redoing work is better than dropping the event
+        print(f"Webhook idempotency claim failed for {event_id}: {e}")
+        return None
+
+
+def is_done(event_id):
+    try:
+        return Config.REDIS_CLIENT.get(_key(event_id)) == DONE
+    except redis.RedisError as e:
+        print(f"Webhook idempotency lookup failed for {event_id}: {e}")
+        return False
+
+
+def mark_done(event_id):
+    try:
+        Config.REDIS_CLIENT.set(_key(event_id), DONE, ex=Config.WEBHOOK_DONE_TTL_SECONDS)
+    except redis.RedisError as e:
+        print(f"Webhook idempotency update failed for {event_id}: {e}")
+
+
+def release_event(event_id):
+    try:
+        Config.REDIS_CLIENT.delete(_key(event_id))
+    except redis.RedisError as e:
+        print(f"Webhook idempotency release failed for {event_id}: {e}")
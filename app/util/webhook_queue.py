@@ -0,0 +1,258 @@
+import json
+import socket
+import os
+import time
+import zlib
+import traceback
+import redis
+import stripe
+from app.config import Config
+from app.util.stripe_utils import send_sns_notification
+
+# Verified webhook events waiting for webhook_worker.py, partitioned by Stripe
+# customer id into WEBHOOK_PARTITIONS streams. Each entry holds the raw
+# payload as Stripe sent it and is acknowledged once its handlers succeed.
+#
+# A partition is worked by one worker at a time (it holds the partition
+# lease), which applies its events one by one in `created` order. Events of
+# one customer are therefore serialized, while different customers are spread
+# over partitions and handled in parallel. All holders of a partition read
+# it as the same consumer, so whoever takes over a partition after a crash
+# resumes from the entries the previous holder left unacknowledged.
+#
+# Streams are never capped by length: that would trim events that are still
+# waiting behind a failed one or for a stopped worker. Instead a partition is
+# trimmed, after a batch, only below its oldest unacknowledged entry.
+STREAM_KEY = "stripe:webhook:events:{}"
+LEASE_KEY = "stripe:webhook:partition:{}:lease"
+# Hash entry id -> handler attempts. Entries are re-read from the pending list
+# on every sweep (while they wait out the reorder window or sit behind a failed
+# event), so Redis' own delivery counter says nothing about handler attempts.
+ATTEMPTS_KEY = "stripe:webhook:partition:{}:attempts"
+DEAD_LETTER_KEY = "stripe:webhook:dead"
+CONSUMER_GROUP = "webhook-workers"
+
+class RetryLater(Exception):
+    """
+    Raised by a handler when an event cannot be applied yet (e.g. another
+    worker still holds its idempotency claim). The partition backs off as
+    for a failure, but the attempt is not counted towards dead-lettering.
+    """
+
+
+# Deletes the lease only if it is still held by the caller
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_release = Config.REDIS_CLIENT.register_script(_RELEASE_SCRIPT)
+
+
+def partition_key(event):
+    """Stripe customer id the event belongs to, or the object id when it has none."""
+    obj = event['data']['object']
+    if obj.get('object') == 'customer':
+        return obj['id']
+    return obj.get('customer') or obj.get('id') or event['id']
+
+
+def partition_for(key):
+    # crc32 rather than hash(): it must agree across processes
+    return zlib.crc32(key.encode('utf-8')) % Config.WEBHOOK_PARTITIONS
+
+
+def enqueue_event(event, payload):
+    """Persist a verified event for the worker pool. Raises redis.RedisError if Redis is unavailable."""
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    partition = partition_for(partition_key(event))
+    return Config.REDIS_CLIENT.xadd(
+        STREAM_KEY.format(partition),
+        {"id": event['id'], "type": event['type'], "created": event['created'], "payload": payload},
+    )
+
+
+def ensure_consumer_group():
+    for partition in range(Config.WEBHOOK_PARTITIONS):
+        try:
+            Config.REDIS_CLIENT.xgroup_create(STREAM_KEY.format(partition), CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+def consumer_name(index):
+    return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+
+def _partition_consumer(partition):
+    return f"partition-{partition}"
+
+
+def _to_event(fields):
+    return stripe.Event.construct_from(json.loads(fields["payload"]), stripe.api_key)
+
+
+def _entry_order(entry_id):
+    millis, seq = entry_id.split("-")
+    return int(millis), int(seq)
+
+
+def _dead_letter(partition, entry_id, fields, error):
+    with Config.REDIS_CLIENT.pipeline() as pipe:
+        # Dead letters are kept until an operator removes them
+        pipe.xadd(DEAD_LETTER_KEY, {**fields, "error": str(error)[:1000]})
+        pipe.xack(STREAM_KEY.format(partition), CONSUMER_GROUP, entry_id)
+        pipe.hdel(ATTEMPTS_KEY.format(partition), entry_id)
+        pipe.execute()
+    send_sns_notification(
+        subject='❌ Stripe Webhook Dead-Lettered',
+        message=f"Event {fields.get('id')} ({fields.get('type')}) failed {Config.WEBHOOK_MAX_DELIVERIES} times: {error}"
+    )
+
+
+def _acknowledge(partition, entry_id):
+    with Config.REDIS_CLIENT.pipeline() as pipe:
+        pipe.xack(STREAM_KEY.format(partition), CONSUMER_GROUP, entry_id)
+        pipe.hdel(ATTEMPTS_KEY.format(partition), entry_id)
+        pipe.execute()
+
+
+def _drop_lost_entry(partition, entry_id):
+    """
+    A pending entry whose payload is gone was deleted from the stream before
+    it was handled. Record it in the dead-letter stream and acknowledge it,
+    otherwise it would be re-read on every sweep.
+    """
+    print(f"Queued webhook entry {entry_id} of partition {partition} was removed before it was handled")
+    with Config.REDIS_CLIENT.pipeline() as pipe:
+        pipe.xadd(DEAD_LETTER_KEY, {"partition": partition, "entry": entry_id, "error": "Entry removed from the stream before it was handled"})
+        pipe.xack(STREAM_KEY.format(partition), CONSUMER_GROUP, entry_id)
+        pipe.hdel(ATTEMPTS_KEY.format(partition), entry_id)
+        pipe.execute()
+    send_sns_notification(
+        subject='❌ Stripe Webhook Lost',
+        message=f"Queued webhook entry {entry_id} of partition {partition} was removed from the stream before it was handled"
+    )
+
+
+def _trim_partition(partition):
+    """Drop acknowledged entries: everything below the oldest pending or unread one."""
+    stream = STREAM_KEY.format(partition)
+    pending = Config.REDIS_CLIENT.xpending(stream, CONSUMER_GROUP)
+    if pending["pending"]:
+        min_id = pending["min"]
+    else:
+        groups = Config.REDIS_CLIENT.xinfo_groups(stream)
+        group = next((g for g in groups if g["name"] == CONSUMER_GROUP), None)
+        if group is None:
+            return
+        # Everything up to the last delivered entry has been acknowledged
+        min_id = group["last-delivered-id"]
+    Config.REDIS_CLIENT.xtrim(stream, minid=min_id, approximate=False)
+
+
+def _read_partition(partition, batch_size):
+    """Unacknowledged entries left from earlier sweeps first, then new ones."""
+    stream = STREAM_KEY.format(partition)
+    consumer = _partition_consumer(partition)
+    response = Config.REDIS_CLIENT.xreadgroup(CONSUMER_GROUP, consumer, {stream: "0"}, count=batch_size)
+    entries = []
+    for entry_id, fields in (response[0][1] if response else []):
+        if fields:
+            entries.append((entry_id, fields))
+        else:
+            _drop_lost_entry(partition, entry_id)
+    if len(entries) < batch_size:
+        response = Config.REDIS_CLIENT.xreadgroup(CONSUMER_GROUP, consumer, {stream: ">"}, count=batch_size - len(entries))
+        entries += response[0][1] if response else []
+    return entries
+
+
+def _work_partition(partition, handler, batch_size):
+    """
+    Apply one batch of a partition in `created` order. Returns how many
+    events were handled, or None when an event failed and the partition
+    should back off before retrying it.
+    """
+    entries = _read_partition(partition, batch_size)
+    # Stripe does not deliver in order: hold entries for a short reorder window
+    # so an older event arriving slightly late is still applied first
+    ready_before = (time.time() * 1000) - Config.WEBHOOK_REORDER_WINDOW_MS
+    entries.sort(key=lambda entry: (int(entry[1].get("created") or 0), _entry_order(entry[0])))
+    handled = 0
+    for entry_id, fields in entries:
+        if _entry_order(entry_id)[0] > ready_before:
+            break
+        # Counted only when the handler actually runs
+        attempts = Config.REDIS_CLIENT.hincrby(ATTEMPTS_KEY.format(partition), entry_id, 1)
+        try:
+            handler(_to_event(fields))
+        except RetryLater as e:
+            print(f"Deferring queued event {fields.get('id')} ({fields.get('type')}): {e}")
+            Config.REDIS_CLIENT.hincrby(ATTEMPTS_KEY.format(partition), entry_id, -1)
+            return None
+        except Exception as e:
+            print(f"Error handling queued event {fields.get('id')} ({fields.get('type')}), attempt {attempts}: {e}\n{traceback.format_exc()}")
+            if attempts < Config.WEBHOOK_MAX_DELIVERIES:
+                # Later events of this partition wait behind the failed one
+                return None
+            _dead_letter(partition, entry_id, fields, e)
+            continue
+        _acknowledge(partition, entry_id)
+        handled += 1
+    if handled:
+        _trim_partition(partition)
+    return handled
+
+
+def consume(consumer, handler, stop_event, batch_size=10, idle_wait_seconds=0.5):
+    """
+    Worker loop: sweep the partitions, work each one whose lease is free, and
+    run `handler(event)` on its events. Runs until stop_event is set.
+    """
+    # Start sweeps at different partitions so workers do not contend for the same leases
+    offset = zlib.crc32(consumer.encode('utf-8'))
+    while not stop_event.is_set():
+        handled_any = False
+        for i in range(Config.WEBHOOK_PARTITIONS):
+            if stop_event.is_set():
+                return
+            partition = (offset + i) % Config.WEBHOOK_PARTITIONS
+            lease = LEASE_KEY.format(partition)
+            try:
+                if not Config.REDIS_CLIENT.set(lease, consumer, nx=True, ex=Config.WEBHOOK_PROCESSING_TTL_SECONDS):
+                    continue
+                handled = _work_partition(partition, handler, batch_size)
+                if handled is None:
+                    # Keep the lease until the retry delay has passed, so nobody retries sooner
+                    Config.REDIS_CLIENT.pexpire(lease, Config.WEBHOOK_RETRY_IDLE_MS)
+                    continue
+                _release(keys=[lease], args=[consumer])
+                handled_any = handled_any or handled > 0
+            except redis.RedisError as e:
+                print(f"Webhook queue error for {consumer} on partition {partition}: {e}")
+                try:
+                    _release(keys=[lease], args=[consumer])
+                except redis.RedisError:
+                    pass  # The lease expires on its own
+                stop_event.wait(1)
+        offset += 1
+        if not handled_any:
+            stop_event.wait(idle_wait_seconds)
+
+
+def queue_depth():
+    """Events not yet handled (pending with a worker or not yet read), over all partitions."""
+    depth = 0
+    for partition in range(Config.WEBHOOK_PARTITIONS):
+        stream = STREAM_KEY.format(partition)
+        groups = Config.REDIS_CLIENT.xinfo_groups(stream) if Config.REDIS_CLIENT.exists(stream) else []
+        group = next((g for g in groups if g['name'] == CONSUMER_GROUP), None)
+        if group is None:
+            depth += Config.REDIS_CLIENT.xlen(stream)
+        else:
+            depth += (group.get('lag') or 0) + group.get('pending', 0)
+    return depth
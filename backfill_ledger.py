@@ -0,0 +1,48 @@
+"""
+Seed the local SQL ledger (charges, refunds, payouts, invoices) from Stripe.
+
+Creates the ledger tables if needed (the app also does at startup), then walks every page of Charge.list,
+Refund.list, Payout.list and Invoice.list (optionally only objects created since a date)
+and upserts them. Webhook events keep the ledger current afterwards.
+
+Usage: python backfill_ledger.py [--since YYYY-MM-DD]
+"""
+import argparse
+import time
+import stripe
+from app import create_app
+from app.models.user import db
+from app.util.ledger import ensure_ledger_tables, upsert_charge, upsert_refund, upsert_payout, upsert_invoice
+from app.util.transaction_query import created_range
+
+COMMIT_EVERY = 500
+
+
+def backfill(list_fn, upsert, label, created, **params):
+    synced_at = int(time.time())
+    if created:
+        params['created'] = created
+    count = 0
+    for obj in list_fn(limit=100, **params).auto_paging_iter():
+        upsert(obj, synced_at)
+        count += 1
+        if count % COMMIT_EVERY == 0:
+            db.session.commit()
+            print(f"{label}: {count} synced")
+    db.session.commit()
+    print(f"{label}: {count} synced (done)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill the local Stripe ledger")
+    parser.add_argument("--since", help="Only objects created on or after this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    created = created_range(args.since, None)
+    app = create_app()
+    with app.app_context():
+        ensure_ledger_tables()
+        backfill(stripe.Charge.list, upsert_charge, "charges", created)
+        # Expanding the charge gives each refund its customer without extra calls
+        backfill(stripe.Refund.list, upsert_refund, "refunds", created, expand=['data.charge'])
+        backfill(stripe.Payout.list, upsert_payout, "payouts", created)
+        backfill(stripe.Invoice.list, upsert_invoice, "invoices", created)
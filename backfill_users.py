@@ -0,0 +1,72 @@
+"""
+Backfill/maintenance for the Users table.
+
+Creates the emailLower and stripeCustomerId GSIs if they are missing and
+writes the normalized emailLower attribute on every existing user item
+that lacks it. DynamoDB only allows one GSI to be created at a time, so
+run the script again once the first index is ACTIVE.
+
+Usage: python backfill_users.py [--skip-index] [--segments N]
+"""
+import argparse
+from app.config import Config
+from app.util.dynamo_scan import scan_all
+from app.util.users_repository import normalize_email
+
+
+def ensure_index(table, index_name, attribute_name):
+    client = Config.DYNAMODB_RESOURCE.meta.client
+    description = client.describe_table(TableName=table.name)["Table"]
+    existing = [gsi["IndexName"] for gsi in description.get("GlobalSecondaryIndexes", [])]
+    if index_name in existing:
+        print(f"Index {index_name} already exists on {table.name}")
+        return
+    building = [gsi["IndexName"] for gsi in description.get("GlobalSecondaryIndexes", []) if gsi.get("IndexStatus") == "CREATING"]
+    if building:
+        print(f"Index {building[0]} is still building on {table.name}; re-run to create {index_name}")
+        return
+    create = {
+        "IndexName": index_name,
+        "KeySchema": [{"AttributeName": attribute_name, "KeyType": "HASH"}],
+        "Projection": {"ProjectionType": "ALL"},
+    }
+    billing = description.get("BillingModeSummary", {}).get("BillingMode", "PROVISIONED")
+    if billing == "PROVISIONED":
+        throughput = description["ProvisionedThroughput"]
+        create["ProvisionedThroughput"] = {
+            "ReadCapacityUnits": throughput["ReadCapacityUnits"],
+            "WriteCapacityUnits": throughput["WriteCapacityUnits"],
+        }
+    client.update_table(
+        TableName=table.name,
+        AttributeDefinitions=[{"AttributeName": attribute_name, "AttributeType": "S"}],
+        GlobalSecondaryIndexUpdates=[{"Create": create}],
+    )
+    print(f"Creating index {index_name} on {table.name} (builds in the background)")
+
+
+def backfill_email_lower(table, segments):
+    scanned = updated = 0
+    for item in scan_all(table, projection=["userId", "email", "emailLower"], segments=segments):
+        scanned += 1
+        email_lower = normalize_email(item.get("email"))
+        if email_lower and item.get("emailLower") != email_lower:
+            table.update_item(
+                Key={"userId": item["userId"]},
+                UpdateExpression="SET emailLower=:el",
+                ExpressionAttributeValues={":el": email_lower}
+            )
+            updated += 1
+    print(f"Scanned {scanned} users, backfilled emailLower on {updated}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill Users lookup attributes and indexes")
+    parser.add_argument("--skip-index", action="store_true", help="Do not create missing GSIs")
+    parser.add_argument("--segments", type=int, default=Config.DYNAMODB_SCAN_SEGMENTS, help="Parallel scan segments")
+    args = parser.parse_args()
+    users_table = Config.USERS_TABLE
+    if not args.skip_index:
+        ensure_index(users_table, Config.USERS_EMAIL_INDEX, "emailLower")
+        ensure_index(users_table, Config.USERS_CUSTOMER_INDEX, "stripeCustomerId")
+    backfill_email_lower(users_table, args.segments)
@@ -0,0 +1,99 @@
+"""
+Benchmark: resolving a Stripe customer id to a user, filtered scan vs GSI query.
+
+Runs against DynamoDB Local (https://hub.docker.com/r/amazon/dynamodb-local):
+
+    docker run -p 8000:8000 amazon/dynamodb-local
+    python -m benchmarks.customer_lookup --sizes 1000 5000 20000
+
+A throwaway Users-shaped table with the stripeCustomerId GSI is created,
+grown to each size, and dropped at the end. The scan time grows with the
+table while the query time stays flat.
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+from app.util.dynamo_scan import scan_all
+from app.util.users_repository import UsersRepository
+from app.config import Config
+
+
+def create_table(dynamodb, name):
+    table = dynamodb.create_table(
+        TableName=name,
+        KeySchema=[{"AttributeName": "userId", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": "userId", "AttributeType": "S"},
+            {"AttributeName": "stripeCustomerId", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[{
+            "IndexName": Config.USERS_CUSTOMER_INDEX,
+            "KeySchema": [{"AttributeName": "stripeCustomerId", "KeyType": "HASH"}],
+            "Projection": {"ProjectionType": "ALL"},
+        }],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    table.wait_until_exists()
+    return table
+
+
+def grow_table(table, customer_ids, target):
+    with table.batch_writer() as batch:
+        while len(customer_ids) < target:
+            customer_id = f"cus_{uuid.uuid4().hex[:14]}"
+            customer_ids.append(customer_id)
+            batch.put_item(Item={
+                "userId": str(uuid.uuid4()),
+                "email": f"{customer_id}@example.com",
+                "stripeCustomerId": customer_id,
+                "subscriptionStatus": "complete",
+                "planOpted": "pro",
+            })
+
+
+def scan_lookup(customer_id, table):
+    return list(scan_all(table, filter_expression=Attr("stripeCustomerId").eq(customer_id)))
+
+
+def gsi_lookup(customer_id, table):
+    return UsersRepository(table).list_by_stripe_customer_id(customer_id)
+
+
+def time_lookups(lookup, table, customer_ids, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        lookup(random.choice(customer_ids), table)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoint", default=os.environ.get("DYNAMODB_ENDPOINT", "http://localhost:8000"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource(
+        "dynamodb",
+        endpoint_url=args.endpoint,
+        region_name="us-east-1",
+        aws_access_key_id="bench",
+        aws_secret_access_key="bench",
+    )
+    table = create_table(dynamodb, f"UsersBench-{uuid.uuid4().hex[:8]}")
+    customer_ids = []
+    try:
+        print(f"{'users':>8} {'scan ms':>10} {'gsi ms':>10}")
+        for size in args.sizes:
+            grow_table(table, customer_ids, size)
+            scan_ms = time_lookups(scan_lookup, table, customer_ids, args.rounds)
+            query_ms = time_lookups(gsi_lookup, table, customer_ids, args.rounds)
+            print(f"{size:>8} {scan_ms:>10.2f} {query_ms:>10.2f}")
+    finally:
+        table.delete()
@@ -0,0 +1,64 @@
+"""
+Benchmark: Stripe call latency with and without the pooled HTTP transport.
+
+Runs against stripe-mock (https://github.com/stripe/stripe-mock):
+
+    docker run -p 12111:12111 stripe/stripe-mock
+    python -m benchmarks.stripe_transport --requests 500 --threads 16
+
+Three transports issue the same Customer.retrieve calls from a thread pool:
+  no-keepalive  every call sends Connection: close and reconnects
+  default       stripe's built-in client (one session per thread)
+  pooled        app.util.stripe_client.build_http_client (one shared pool)
+Point --api-base at an https endpoint to include TLS handshakes in the cost.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import stripe
+
+from app.util.stripe_client import RequestsClient, build_http_client
+
+
+def no_keepalive_client():
+    """Client whose requests ask the server to close the connection, so every call reconnects."""
+    session = requests.Session()
+    session.headers["Connection"] = "close"
+    return RequestsClient(session=session)
+
+
+def run(label, http_client, total, threads):
+    stripe.default_http_client = http_client
+    latencies = []
+
+    def call(_):
+        started = time.perf_counter()
+        stripe.Customer.retrieve("cus_bench")
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:>14} {statistics.median(latencies):>9.2f} {p95:>9.2f} {total / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--api-base", default="http://localhost:12111")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    stripe.api_key = "sk_test_123"
+    stripe.api_base = args.api_base
+    stripe.max_network_retries = 0
+    print(f"{'transport':>14} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>10}")
+    run("no-keepalive", no_keepalive_client(), args.requests, args.threads)
+    run("default", RequestsClient(), args.requests, args.threads)
+    run("pooled", build_http_client(), args.requests, args.threads)
@@ -0,0 +1,162 @@
+"""
+Re-apply Stripe events to this service, e.g. after an outage or a handler fix.
+
+Pages through stripe.Event.list for a time range (Stripe keeps events for 30
+days) and an optional event-type filter, and runs each event through the
+webhook handlers. The range is replayed in windows: each window is listed in
+full, sorted oldest first and spread over worker threads by Stripe customer
+id, so one customer's events are still applied in order while different
+customers run concurrently. After each window the checkpoint file records
+how far the replay got; re-running with the same file resumes from there.
+
+Events already handled (per the webhook idempotency ledger) are skipped
+unless --force is given, which is what you want after fixing a handler bug.
+The ledger only remembers events for WEBHOOK_DONE_TTL_SECONDS, so a --since
+older than that is refused without --force: events handled before then
+would run (and notify users) again.
+
+Usage: python replay_events.py --since 2026-10-01T00:00 [--until ...]
+           [--type customer.subscription.*] [--type invoice.paid]
+           [--concurrency 8] [--window-minutes 60]
+           [--checkpoint replay_checkpoint.json] [--force]
+"""
+import argparse
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import stripe
+from app import create_app
+from app.config import Config
+from app.util.webhook_dispatch import dispatch_event, dispatch_event_once
+from app.util.webhook_queue import partition_key
+
+# Stripe accepts up to 20 exact types in `types`; wildcards only in `type`
+MAX_LIST_TYPES = 20
+
+
+def parse_time(value):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def type_filters(types):
+    if not types:
+        return [{}]
+    if len(types) == 1:
+        return [{"type": types[0]}]
+    wildcards = [t for t in types if "*" in t]
+    exact = [t for t in types if "*" not in t]
+    filters = [{"type": t} for t in wildcards]
+    for start in range(0, len(exact), MAX_LIST_TYPES):
+        filters.append({"types": exact[start:start + MAX_LIST_TYPES]})
+    return filters
+
+
+def list_window(start, end, types):
+    """Every event created in [start, end) matching the filters, oldest first."""
+    events = {}
+    for params in type_filters(types):
+        for event in stripe.Event.list(created={"gte": start, "lt": end}, limit=100, **params).auto_paging_iter():
+            events[event["id"]] = event
+    return sorted(events.values(), key=lambda event: (event["created"], event["id"]))
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def replay_lane(app, events, handler):
+    """Apply one lane's events in order. Returns (handled, skipped, failed event ids)."""
+    handled, skipped, failed = 0, 0, []
+    for event in events:
+        # A fresh app context (and SQLAlchemy session) per event, so one failed
+        # transaction does not fail the rest of the lane
+        with app.app_context():
+            try:
+                if handler(event) is None:
+                    handled += 1
+                else:
+                    skipped += 1
+            except Exception as e:
+                print(f"Failed to replay {event['id']} ({event['type']}): {e}")
+                failed.append(event["id"])
+    return handled, skipped, failed
+
+
+def replay_window(app, executor, events, concurrency, handler):
+    lanes = [[] for _ in range(concurrency)]
+    for event in events:
+        lane = zlib.crc32(partition_key(event).encode("utf-8")) % concurrency
+        lanes[lane].append(event)
+    futures = [executor.submit(replay_lane, app, lane, handler) for lane in lanes if lane]
+    totals = [0, 0, []]
+    for future in futures:
+        handled, skipped, failed = future.result()
+        totals[0] += handled
+        totals[1] += skipped
+        totals[2] += failed
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay Stripe events through the webhook handlers")
+    parser.add_argument("--since", required=True, help="Replay events created at or after this time (ISO 8601, UTC if no offset)")
+    parser.add_argument("--until", help="Replay events created before this time (default: now)")
+    parser.add_argument("--type", dest="types", action="append", help="Event type filter, wildcards allowed (repeatable)")
+    parser.add_argument("--concurrency", type=positive_int, default=8, help="Worker threads")
+    parser.add_argument("--window-minutes", type=positive_int, default=60, help="Time window listed and checkpointed at a time")
+    parser.add_argument("--checkpoint", help="JSON file recording progress; resume from it if it exists")
+    parser.add_argument("--force", action="store_true", help="Re-run handlers even for events already marked done")
+    args = parser.parse_args()
+
+    since = parse_time(args.since)
+    until = parse_time(args.until) if args.until else int(time.time())
+    if not args.force and since < time.time() - Config.WEBHOOK_DONE_TTL_SECONDS:
+        parser.error(f"--since is older than WEBHOOK_DONE_TTL_SECONDS ({Config.WEBHOOK_DONE_TTL_SECONDS}s); "
+                     "handled events from before then are no longer recorded and would run again. Pass --force to replay anyway.")
+    checkpoint = load_checkpoint(args.checkpoint) or {"since": since, "until": until, "completed_through": since, "failed": []}
+    handler = dispatch_event if args.force else dispatch_event_once
+    window = args.window_minutes * 60
+
+    app = create_app()
+    start = max(since, checkpoint["completed_through"])
+    if start > since:
+        print(f"Resuming from checkpoint at {datetime.fromtimestamp(start, timezone.utc).isoformat()}")
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="replay") as executor:
+        while start < until:
+            end = min(start + window, until)
+            events = list_window(start, end, args.types)
+            handled, skipped, failed = replay_window(app, executor, events, args.concurrency, handler)
+            checkpoint["completed_through"] = end
+            checkpoint["failed"].extend(failed)
+            save_checkpoint(args.checkpoint, checkpoint)
+            print(f"{datetime.fromtimestamp(end, timezone.utc).isoformat()}: {len(events)} events, "
+                  f"{handled} applied, {skipped} already handled, {len(failed)} failed")
+            start = end
+    if checkpoint["failed"]:
+        print(f"{len(checkpoint['failed'])} events failed: {', '.join(checkpoint['failed'])}")
+        raise SystemExit(1)
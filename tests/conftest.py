@@ -0,0 +1,38 @@
+import os
+from unittest import mock
+
+import fakeredis
+import pytest
+
+# app.config builds boto3 clients at import time
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite://")
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    # The flask_restx Api is module-level, so the app can only be created once
+    import app as app_package
+    with mock.patch.object(app_package, "ensure_sender"):
+        flask_app = app_package.create_app()
+    flask_app.config["TESTING"] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    from app.config import Config
+    from app.util import stripe_catalog_cache, subscription_stats, webhook_queue
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(Config, "REDIS_CLIENT", client)
+    # Lua scripts are registered on the real client at import time
+    monkeypatch.setattr(stripe_catalog_cache, "_set_if_newer", client.register_script(stripe_catalog_cache._SET_IF_NEWER_SCRIPT))
+    monkeypatch.setattr(subscription_stats, "_transition", client.register_script(subscription_stats._TRANSITION_SCRIPT))
+    monkeypatch.setattr(subscription_stats, "_prune", client.register_script(subscription_stats._PRUNE_SCRIPT))
+    monkeypatch.setattr(webhook_queue, "_release", client.register_script(webhook_queue._RELEASE_SCRIPT))
+    return client
@@ -0,0 +1,44 @@
+from unittest import mock
+
+import stripe
+
+from app.config import Config
+from app.models.user import db
+from app.util.ledger import get_invoice, upsert_invoice, upsert_payout
+
+
+def _payout(payout_id, created):
+    return {"id": payout_id, "object": "payout", "amount": 1000, "currency": "usd",
+            "status": "paid", "arrival_date": created, "created": created}
+
+
+def test_ledger_pages_follow_the_cursor_and_reject_unknown_ones(flask_app, client, monkeypatch):
+    monkeypatch.setattr(Config, "LEDGER_READS_ENABLED", True)
+    with flask_app.app_context():
+        for i in range(3):
+            upsert_payout(_payout(f"po_{i}", 100 + i))
+        db.session.commit()
+
+    first = client.get("/membership/account/payouts?limit=2").get_json()
+    assert [p["id"] for p in first["payouts"]] == ["po_2", "po_1"]
+    assert first["next_starting_after"] == "po_1"
+    second = client.get("/membership/account/payouts?limit=2&starting_after=po_1").get_json()
+    assert [p["id"] for p in second["payouts"]] == ["po_0"]
+    assert second["has_more"] is False
+
+    response = client.get("/membership/account/payouts?limit=2&starting_after=po_from_stripe_mode")
+    assert response.status_code == 400
+
+
+def test_draft_invoice_in_the_mirror_is_refreshed_from_stripe(flask_app):
+    draft = {"id": "in_1", "object": "invoice", "customer": "cus_1", "status": "draft",
+             "invoice_pdf": None, "hosted_invoice_url": None, "created": 100}
+    final = {**draft, "status": "paid", "invoice_pdf": "https://pay.stripe.com/invoice/in_1/pdf"}
+    with flask_app.app_context():
+        upsert_invoice(draft, synced_at=100)
+        db.session.commit()
+        with mock.patch.object(stripe.Invoice, "retrieve", return_value=final) as retrieve:
+            assert get_invoice("in_1")["invoice_pdf"] == final["invoice_pdf"]
+            # Now final in the mirror: served without Stripe
+            assert get_invoice("in_1")["invoice_pdf"] == final["invoice_pdf"]
+        retrieve.assert_called_once_with("in_1")
@@ -0,0 +1,29 @@
+import json
+from unittest import mock
+
+from app.util import notification_outbox
+
+
+def _failing_email():
+    return {"kind": "ses", "source": "a@example.com", "to": "b@example.com", "template": "T", "template_data": "{}"}
+
+
+def test_identical_failed_messages_are_retried_separately(fake_redis):
+    with mock.patch.object(notification_outbox, "ensure_sender"):
+        notification_outbox._enqueue(_failing_email())
+        notification_outbox._enqueue(_failing_email())
+    messages = [json.loads(raw) for raw in fake_redis.lrange(notification_outbox.OUTBOX_KEY, 0, -1)]
+
+    notification_outbox._schedule_retries(messages)
+
+    assert fake_redis.zcard(notification_outbox.RETRY_KEY) == 2
+
+
+def test_exhausted_messages_are_dead_lettered(fake_redis):
+    message = {**_failing_email(), "id": "msg_1", "attempts": notification_outbox.MAX_ATTEMPTS - 1}
+
+    notification_outbox._schedule_retries([message])
+
+    assert fake_redis.zcard(notification_outbox.RETRY_KEY) == 0
+    dead = [json.loads(raw) for raw in fake_redis.lrange(notification_outbox.DEAD_LETTER_KEY, 0, -1)]
+    assert [m["id"] for m in dead] == ["msg_1"]
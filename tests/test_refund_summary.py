@@ -0,0 +1,25 @@
+from unittest import mock
+
+from app.util import transaction_query
+
+
+def test_refund_summary_reads_only_the_customers_charges(client):
+    page = mock.Mock()
+    page.auto_paging_iter.return_value = iter([{
+        "id": "ch_1",
+        "object": "charge",
+        "created": 100,
+        "amount_refunded": 250,
+        "refunds": {"object": "list", "has_more": False, "data": [
+            {"id": "re_1", "object": "refund", "created": 200, "amount": 250, "charge": "ch_1"},
+        ]},
+    }])
+    with mock.patch.object(transaction_query.stripe.Charge, "list", return_value=page) as charge_list, \
+            mock.patch.object(transaction_query.stripe.Refund, "list") as refund_list:
+        response = client.get("/membership/refund-summary?stripe_customer_id=cus_1")
+
+    assert response.status_code == 200
+    assert response.get_json()["total_refunded"] == 2.5
+    assert response.get_json()["refund_count"] == 1
+    charge_list.assert_called_once_with(customer="cus_1", limit=100, expand=["data.refunds"])
+    refund_list.assert_not_called()
@@ -0,0 +1,33 @@
+from unittest import mock
+
+from app.util import stripe_catalog_cache
+
+
+def _event(event_type, created, name):
+    return {"type": event_type, "created": created, "data": {"object": {"id": "prod_1", "object": "product", "name": name}}}
+
+
+def test_late_event_does_not_overwrite_newer_copy(fake_redis):
+    stripe_catalog_cache.handle_catalog_event(_event("product.updated", 200, "new"))
+    stripe_catalog_cache.handle_catalog_event(_event("product.updated", 100, "old"))
+
+    assert stripe_catalog_cache.get_catalog_object("product", "prod_1")["name"] == "new"
+
+
+def test_slow_read_through_does_not_overwrite_a_modify(fake_redis):
+    def slow_retrieve(object_id):
+        # A modify lands while the retrieve is in flight
+        stripe_catalog_cache.cache_catalog_object({"id": object_id, "object": "product", "name": "modified"})
+        return {"id": object_id, "object": "product", "name": "stale"}
+
+    with mock.patch.object(stripe_catalog_cache.stripe.Product, "retrieve", side_effect=slow_retrieve):
+        assert stripe_catalog_cache.get_catalog_object("product", "prod_1")["name"] == "stale"
+
+    assert stripe_catalog_cache.get_catalog_object("product", "prod_1")["name"] == "modified"
+
+
+def test_late_update_after_delete_is_not_cached(fake_redis):
+    stripe_catalog_cache.handle_catalog_event(_event("product.deleted", 200, "gone"))
+    stripe_catalog_cache.handle_catalog_event(_event("product.updated", 100, "old"))
+
+    assert stripe_catalog_cache._object_get(stripe_catalog_cache._object_key("product", "prod_1")) is None
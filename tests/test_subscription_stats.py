@@ -0,0 +1,56 @@
+from unittest import mock
+
+import redis
+
+from app.config import Config
+from app.util import subscription_stats
+
+
+def _event(sub_id, status, created):
+    return {"created": created, "data": {"object": {"id": sub_id, "status": status}}}
+
+
+def _walk(subscriptions):
+    page = mock.Mock()
+    page.auto_paging_iter.return_value = iter(subscriptions)
+    return page
+
+
+def test_reconcile_keeps_transitions_applied_during_the_walk(fake_redis):
+    subscription_stats.record_subscription_event(_event("sub_a", "active", 100))
+    subscription_stats.record_subscription_event(_event("sub_gone", "active", 100))
+    walked = [{"id": "sub_a", "status": "active"}, {"id": "sub_b", "status": "trialing"}]
+
+    def list_while_webhook_arrives(**_):
+        # A webhook newer than the walk's start lands while Stripe is being paged
+        subscription_stats.record_subscription_event(_event("sub_a", "past_due", 2_000_000_000))
+        return _walk(walked)
+
+    with mock.patch.object(subscription_stats.stripe.Subscription, "list", side_effect=list_while_webhook_arrives):
+        counts = subscription_stats.reconcile_status_counts()
+
+    assert counts == {"past_due": 1, "trialing": 1}
+    assert subscription_stats.get_status_counts() == {"past_due": 1, "trialing": 1}
+
+
+def test_reconcile_prunes_old_tombstones_only(fake_redis):
+    subscription_stats.record_subscription_event(_event("sub_old", "canceled", 100))
+    recent = 2_000_000_000 - 60
+    subscription_stats.record_subscription_event(_event("sub_recent", "canceled", recent))
+
+    with mock.patch.object(subscription_stats.time, "time", return_value=2_000_000_000), \
+            mock.patch.object(subscription_stats.stripe.Subscription, "list", return_value=_walk([])):
+        subscription_stats.reconcile_status_counts()
+
+    assert fake_redis.hgetall(subscription_stats.SUBSCRIPTIONS_KEY) == {"sub_recent": f"canceled|{recent}"}
+
+
+def test_counts_fall_back_to_the_walk_when_redis_is_down(monkeypatch):
+    broken = mock.Mock()
+    broken.exists.side_effect = redis.ConnectionError("down")
+    broken.hscan_iter.side_effect = redis.ConnectionError("down")
+    monkeypatch.setattr(Config, "REDIS_CLIENT", broken)
+
+    assert subscription_stats.get_status_counts() is None
+    with mock.patch.object(subscription_stats.stripe.Subscription, "list", return_value=_walk([{"id": "sub_a", "status": "active"}])):
+        assert subscription_stats.reconcile_status_counts() == {"active": 1}
@@ -0,0 +1,65 @@
+from unittest import mock
+
+from app.util import transaction_query
+
+
+def _charge(charge_id, created, refunds):
+    return {
+        "id": charge_id,
+        "object": "charge",
+        "created": created,
+        "amount_refunded": sum(r["amount"] for r in refunds),
+        "refunds": {"object": "list", "data": refunds, "has_more": False},
+    }
+
+
+def _refund(refund_id, created, amount=100):
+    return {"id": refund_id, "object": "refund", "created": created, "amount": amount}
+
+
+def _list(items):
+    page = mock.Mock()
+    page.auto_paging_iter.return_value = iter(items)
+    return page
+
+
+def test_customer_refunds_come_from_the_customers_charges_newest_first():
+    charges = [
+        _charge("ch_new", 500, [_refund("re_a", 510)]),
+        _charge("ch_none", 400, []),
+        _charge("ch_old", 100, [_refund("re_b", 600), _refund("re_c", 150)]),
+    ]
+    with mock.patch.object(transaction_query.stripe.Charge, "list", return_value=_list(charges)) as charge_list, \
+            mock.patch.object(transaction_query.stripe.Refund, "list") as refund_list:
+        refunds = list(transaction_query.iter_customer_refunds("cus_1", {"gte": 200}))
+
+    assert [r["id"] for r in refunds] == ["re_b", "re_a"]
+    charge_list.assert_called_once_with(customer="cus_1", limit=100, expand=["data.refunds"])
+    refund_list.assert_not_called()
+
+
+def test_transactions_window_merges_charges_and_refunds():
+    charges = [
+        _charge("ch_2", 300, [_refund("re_1", 350)]),
+        _charge("ch_1", 100, []),
+    ]
+    with mock.patch.object(transaction_query.stripe.Charge, "list", return_value=_list(charges)) as charge_list:
+        items, has_more = transaction_query.query_customer_transactions("cus_1", limit=2)
+
+    assert [item["id"] for item in items] == ["re_1", "ch_2"]
+    assert has_more is True
+    # Charges and refunds come from the same walk over the charge list
+    charge_list.assert_called_once_with(customer="cus_1", limit=100, expand=["data.refunds"])
+
+
+def test_transactions_window_keeps_charges_in_range_and_late_refunds_of_older_charges():
+    charges = [
+        _charge("ch_3", 400, []),
+        _charge("ch_2", 300, []),
+        _charge("ch_1", 100, [_refund("re_1", 350)]),
+    ]
+    with mock.patch.object(transaction_query.stripe.Charge, "list", return_value=_list(charges)):
+        items, has_more = transaction_query.query_customer_transactions("cus_1", {"gte": 200}, limit=10)
+
+    assert [item["id"] for item in items] == ["ch_3", "re_1", "ch_2"]
+    assert has_more is False
@@ -0,0 +1,131 @@
+import json
+from unittest import mock
+
+import pytest
+
+from app.config import Config
+from app.util import webhook_queue
+
+PARTITION = 0
+
+
+@pytest.fixture
+def fake_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(Config, "WEBHOOK_PARTITIONS", 1)
+    monkeypatch.setattr(Config, "WEBHOOK_REORDER_WINDOW_MS", 0)
+    monkeypatch.setattr(Config, "WEBHOOK_MAX_DELIVERIES", 3)
+    webhook_queue.ensure_consumer_group()
+    with mock.patch.object(webhook_queue, "send_sns_notification"):
+        yield fake_redis
+
+
+def _enqueue(event_id, created, customer="cus_1"):
+    event = {
+        "id": event_id,
+        "object": "event",
+        "type": "customer.subscription.updated",
+        "created": created,
+        "data": {"object": {"id": "sub_1", "object": "subscription", "customer": customer}},
+    }
+    webhook_queue.enqueue_event(event, json.dumps(event))
+
+
+def test_events_are_applied_in_created_order(fake_redis):
+    _enqueue("evt_late", created=300)
+    _enqueue("evt_early", created=100)
+    _enqueue("evt_middle", created=200)
+    seen = []
+
+    handled = webhook_queue._work_partition(PARTITION, lambda event: seen.append(event["id"]), batch_size=10)
+
+    assert handled == 3
+    assert seen == ["evt_early", "evt_middle", "evt_late"]
+    assert webhook_queue.queue_depth() == 0
+
+
+def test_sweeps_inside_reorder_window_do_not_use_up_attempts(fake_redis, monkeypatch):
+    monkeypatch.setattr(Config, "WEBHOOK_REORDER_WINDOW_MS", 60000)
+    _enqueue("evt_1", created=100)
+    handler = mock.Mock()
+
+    for _ in range(10):
+        assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) == 0
+
+    handler.assert_not_called()
+    assert fake_redis.hlen(webhook_queue.ATTEMPTS_KEY.format(PARTITION)) == 0
+
+    monkeypatch.setattr(Config, "WEBHOOK_REORDER_WINDOW_MS", 0)
+    assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) == 1
+    handler.assert_called_once()
+
+
+def test_failed_event_blocks_partition_then_dead_letters_after_max_attempts(fake_redis):
+    _enqueue("evt_bad", created=100)
+    _enqueue("evt_next", created=200)
+    seen = []
+
+    def handler(event):
+        if event["id"] == "evt_bad":
+            raise RuntimeError("boom")
+        seen.append(event["id"])
+
+    # Re-reading the blocked entries on extra sweeps must not count as attempts
+    for _ in range(Config.WEBHOOK_MAX_DELIVERIES - 1):
+        assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) is None
+        assert fake_redis.xlen(webhook_queue.DEAD_LETTER_KEY) == 0
+    assert seen == []
+
+    assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) == 1
+    assert seen == ["evt_next"]
+    dead = fake_redis.xrange(webhook_queue.DEAD_LETTER_KEY)
+    assert [fields["id"] for _, fields in dead] == ["evt_bad"]
+    assert fake_redis.hlen(webhook_queue.ATTEMPTS_KEY.format(PARTITION)) == 0
+    webhook_queue.send_sns_notification.assert_called_once()
+
+
+def test_retry_later_does_not_count_as_an_attempt(fake_redis):
+    _enqueue("evt_claimed", created=100)
+
+    def handler(event):
+        raise webhook_queue.RetryLater("claimed by another worker")
+
+    for _ in range(Config.WEBHOOK_MAX_DELIVERIES * 2):
+        assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) is None
+
+    assert fake_redis.xlen(webhook_queue.DEAD_LETTER_KEY) == 0
+    attempts = fake_redis.hvals(webhook_queue.ATTEMPTS_KEY.format(PARTITION))
+    assert [int(count) for count in attempts] == [0]
+    assert webhook_queue.queue_depth() == 1
+
+
+def test_only_acknowledged_entries_are_trimmed(fake_redis):
+    _enqueue("evt_bad", created=100)
+    _enqueue("evt_next", created=200)
+    stream = webhook_queue.STREAM_KEY.format(PARTITION)
+
+    def handler(event):
+        if event["id"] == "evt_bad":
+            raise RuntimeError("boom")
+
+    assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) is None
+    assert fake_redis.xlen(stream) == 2
+
+    assert webhook_queue._work_partition(PARTITION, lambda event: None, batch_size=10) == 2
+    assert webhook_queue.queue_depth() == 0
+    assert fake_redis.xlen(stream) == 1
+
+
+def test_entry_removed_before_handling_is_dead_lettered(fake_redis):
+    _enqueue("evt_1", created=100)
+    stream = webhook_queue.STREAM_KEY.format(PARTITION)
+    handler = mock.Mock(side_effect=RuntimeError("boom"))
+    assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) is None
+    entry_id = fake_redis.xrange(stream)[0][0]
+    fake_redis.xdel(stream, entry_id)
+
+    assert webhook_queue._work_partition(PARTITION, handler, batch_size=10) == 0
+
+    assert handler.call_count == 1
+    dead = fake_redis.xrange(webhook_queue.DEAD_LETTER_KEY)
+    assert [fields["entry"] for _, fields in dead] == [entry_id]
+    assert webhook_queue.queue_depth() == 0
@@ -0,0 +1,59 @@
+"""
+Run queued Stripe webhook events through the webhook handlers.
+
+With WEBHOOK_ASYNC_INGEST=True the /payment/webhook route only verifies the
+signature, appends the event to a Redis Stream partitioned by Stripe customer
+id and returns 200. This process works those partitions with a pool of worker
+threads (WEBHOOK_WORKERS by default), one thread per partition at a time, in
+event `created` order. Start as many processes as needed; they coordinate
+through per-partition leases in Redis.
+
+Usage: python webhook_worker.py [--workers N]
+"""
+import argparse
+import signal
+import threading
+from app import create_app
+from app.config import Config
+from app.util.webhook_dispatch import dispatch_event_once
+from app.util.webhook_idempotency import PROCESSING
+from app.util.webhook_queue import ensure_consumer_group, consumer_name, consume, RetryLater
+
+
+class EventInProgress(RetryLater):
+    pass
+
+
+def handle_queued_event(app, event):
+    # One app context per event: its teardown removes the SQLAlchemy session,
+    # so a failed transaction or stale identity map never leaks into the next event
+    with app.app_context():
+        if dispatch_event_once(event) == PROCESSING:
+            # Leave the entry pending without using up an attempt: if the other
+            # run fails or crashes (its claim expires), this one retries it
+            raise EventInProgress(f"{event['id']} is being handled by another worker")
+
+
+def run_worker(app, index, stop_event):
+    consume(consumer_name(index), lambda event: handle_queued_event(app, event), stop_event)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process queued Stripe webhook events")
+    parser.add_argument("--workers", type=int, default=Config.WEBHOOK_WORKERS, help="Worker threads in this process")
+    args = parser.parse_args()
+    app = create_app()
+    ensure_consumer_group()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    threads = [
+        threading.Thread(target=run_worker, args=(app, i, stop_event), name=f"webhook-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Webhook worker started with {args.workers} threads")
+    for thread in threads:
+        thread.join()
+    print("Webhook worker stopped")